@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# Benchmarks of simulating synthetic schedules: wide parallels, deep
+# sequences, nested deadline parallels, and calendars with hundreds of
+# holidays, each at a few sizes and with both engines. For each we
+# measure iterations per second of simulate, the peak memory it
+# allocates, and the time to summarize the result, taking the fastest
+# of a few repeats of each to filter out noise.
+#
+#   python benchmark.py                      print results
+#   python benchmark.py --json new.json      also save them
+#   python benchmark.py --compare old.json   flag cases that got worse
+#
+# Everything is seeded so runs differ only in how long they take.
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tracemalloc
+from datetime import date
+from datetime import timedelta
+from time import perf_counter
+
+import numpy as np
+
+from gigamonkeys.montecarlo import calendar
+from gigamonkeys.montecarlo import deadline
+from gigamonkeys.montecarlo.calendar import Calendar
+
+start = date(2020, 6, 1)
+
+
+def wide(m, n):
+    "One parallel of n estimates."
+    return m.parallel("Wide", [m.estimate(f"Task {i}", 5, 10) for i in range(n)])
+
+
+def deep(m, n):
+    "A sequence of n estimates."
+    return m.sequence("Deep", [m.estimate(f"Task {i}", 5, 10) for i in range(n)])
+
+
+def nested(m, depth):
+    "Parallels nested depth deep, each with an estimate alongside."
+    if depth == 0:
+        return m.estimate("Leaf", 5, 10)
+    else:
+        return m.parallel(
+            f"Level {depth}", [m.estimate(f"Task {depth}", 5, 10), nested(m, depth - 1)]
+        )
+
+
+def holidays(n):
+    "A calendar with n days off spread over the years after start."
+    rng = np.random.default_rng(0)
+    offsets = rng.choice(365 * 5, n, replace=False)
+    return Calendar({start + timedelta(days=int(d)) for d in offsets})
+
+
+def cases(sizes):
+    "Generate the name, size, simulation, and run args of each case."
+    few = Calendar({date(2020, 7, 3)})
+    many = holidays(300)
+    usual = dict(start=start, calendar=few)
+    busy = dict(start=start, calendar=many)
+    tight = dict(start=start, due_date=start + timedelta(days=30), calendar=few)
+    for n in sizes["wide"]:
+        yield "wide calendar parallel", n, wide(calendar, n), usual
+    for n in sizes["deep"]:
+        yield "deep calendar sequence", n, deep(calendar, n), usual
+        yield "deep sequence, 300 holidays", n, deep(calendar, n), busy
+        yield "deep deadline sequence", n, deep(deadline, n), tight
+    for depth in sizes["nested"]:
+        yield "nested deadline parallel", depth, nested(deadline, depth), tight
+
+
+def measure(simulation, iters, engine, kwds, repeat):
+    """
+    Time simulating and summarizing, keeping the fastest of repeat
+    runs of each, then simulate again to find peak memory.
+    """
+    simulated = summarized = float("inf")
+    for _ in range(repeat):
+        t = perf_counter()
+        acc = simulation.simulate(iters, engine=engine, seed=0, **kwds)
+        simulated = min(simulated, perf_counter() - t)
+
+        t = perf_counter()
+        simulation.summarize(acc)
+        summarized = min(summarized, perf_counter() - t)
+        del acc
+
+    tracemalloc.start()
+    simulation.simulate(iters, engine=engine, seed=0, **kwds)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "iters_per_sec": iters / simulated,
+        "summarize_sec": summarized,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def run(iters, sizes, engines, repeat):
+    results = []
+    for name, size, simulation, kwds in cases(sizes):
+        for engine in engines:
+            r = {"case": name, "size": size, "engine": engine, "iters": iters}
+            r.update(measure(simulation, iters, engine, kwds, repeat))
+            print(
+                f"{name:<28} {size:>4} {engine:<10} {r['iters_per_sec']:>10.0f}/s"
+                f" {r['summarize_sec']:>7.3f}s {r['peak_mb']:>8.1f}MB",
+                flush=True,
+            )
+            results.append(r)
+    return results
+
+
+def compare(results, old, tolerance):
+    "Print the cases more than tolerance slower, or bigger, than in old."
+
+    def key(r):
+        return r["case"], r["size"], r["engine"]
+
+    before = {key(r): r for r in old["results"]}
+    worse = 0
+    for r in results:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        changes = {
+            "iters/s": b["iters_per_sec"] / r["iters_per_sec"] - 1,
+            "summarize": r["summarize_sec"] / b["summarize_sec"] - 1,
+            "memory": r["peak_mb"] / b["peak_mb"] - 1,
+        }
+        for what, change in changes.items():
+            if change > tolerance:
+                worse += 1
+                print(f"WORSE {what} by {change:.0%}: {' '.join(map(str, key(r)))}")
+    return worse
+
+
+def commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True)
+        return out.stdout.decode().strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark simulations.")
+    parser.add_argument("--iters", type=int, default=20_000)
+    parser.add_argument("--quick", action="store_true", help="only the small sizes")
+    parser.add_argument("--engines", nargs="+", default=["scalar", "vectorized"])
+    parser.add_argument("--repeat", type=int, default=5, help="timings per case")
+    parser.add_argument("--json", help="file to save results to")
+    parser.add_argument("--compare", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.quick:
+        sizes = {"wide": [10], "deep": [10], "nested": [4]}
+    else:
+        sizes = {"wide": [10, 100], "deep": [10, 100], "nested": [4, 8]}
+
+    results = run(args.iters, sizes, args.engines, args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "commit": commit(),
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results, json.load(f), args.tolerance) else 0)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Checks that the run cache and the memo only share results between
+# runs that would give the same ones. Run directly or with pytest.
+
+import tempfile
+from functools import partial
+
+import pytest
+
+from gigamonkeys.montecarlo import Estimate
+from gigamonkeys.montecarlo import Named
+from gigamonkeys.montecarlo.cache import Cache
+from gigamonkeys.montecarlo.memo import Memo
+from gigamonkeys.montecarlo.memo import Uncacheable
+from gigamonkeys.montecarlo.schedule import Sequence
+from gigamonkeys.montecarlo.sketch import KLL
+
+
+class NamedEstimate(Named, Estimate):
+    pass
+
+
+def tree():
+    return Sequence(
+        name="Root",
+        children=[NamedEstimate(name=f"t{i}", low=1, high=5) for i in range(5)],
+    )
+
+
+def test_partial_stores():
+    s = tree()
+    cache = Cache(tempfile.mkdtemp())
+    small, big = partial(KLL, k=8), partial(KLL, k=2000)
+    assert cache.path(s, 1000, dict(seed=1, store=small)) != cache.path(
+        s, 1000, dict(seed=1, store=big)
+    )
+    memo = Memo()
+    assert memo.scope(small, None).prefix != memo.scope(big, None).prefix
+
+    cache.run(s, 50_000, seed=1, store=small)
+    assert cache.run(s, 50_000, seed=1, store=big) == s.run(50_000, seed=1, store=big)
+    assert cache.hits == 0
+
+
+def test_lambda_store():
+    s = tree()
+    cache = Cache(tempfile.mkdtemp())
+
+    def store():
+        return KLL(k=8)
+
+    for unidentifiable in (lambda: KLL(k=8), store):
+        with pytest.raises(Uncacheable):
+            cache.path(s, 1000, dict(seed=1, store=unidentifiable))
+        with pytest.raises(Uncacheable):
+            Memo().scope(unidentifiable, None)
+        expected = s.run(1000, seed=1, store=unidentifiable)
+        assert cache.run(s, 1000, seed=1, store=unidentifiable) == expected
+        assert cache.run(s, 1000, seed=1, store=unidentifiable) == expected
+    assert cache.hits == cache.misses == 0
+
+
+def test_until_precision():
+    cache = Cache(tempfile.mkdtemp())
+    missed = cache.run(tree(), seed=1, until_precision=0.5)
+    hit = cache.run(tree(), seed=1, until_precision=0.5)
+    assert cache.hits == 1
+    assert hit == missed == tree().run(seed=1, until_precision=0.5)
+
+
+if __name__ == "__main__":
+
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
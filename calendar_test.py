@@ -1,9 +1,6 @@
 #!/usr/bin/env python
 
-import datetime
-import json
 import sys
-from dataclasses import asdict
 
 import pendulum
 
@@ -11,16 +8,7 @@ from gigamonkeys.montecarlo.calendar import Calendar
 from gigamonkeys.montecarlo.calendar import estimate
 from gigamonkeys.montecarlo.calendar import parallel
 from gigamonkeys.montecarlo.calendar import sequence
-
-
-def default(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
-        return o.isoformat()
-
-
-def json_dump(x):
-    json.dump(x, fp=sys.stdout, indent=2, default=default)
-
+from gigamonkeys.montecarlo.serialize import dump
 
 if __name__ == "__main__":
 
@@ -35,4 +23,4 @@ if __name__ == "__main__":
     c = Calendar({pendulum.parse("2020-07-03").date()})
     r = s.run(iters=10_000, start=c.today(), calendar=c)
 
-    json_dump(asdict(r))
+    dump(r, sys.stdout, indent=2)
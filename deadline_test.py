@@ -1,9 +1,7 @@
 #!/usr/bin/env python
 
 import datetime
-import json
 import sys
-from dataclasses import asdict
 
 import pendulum
 
@@ -11,16 +9,7 @@ from gigamonkeys.montecarlo.calendar import Calendar
 from gigamonkeys.montecarlo.deadline import estimate
 from gigamonkeys.montecarlo.deadline import parallel
 from gigamonkeys.montecarlo.deadline import sequence
-
-
-def default(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
-        return o.isoformat()
-
-
-def json_dump(x):
-    json.dump(x, fp=sys.stdout, indent=2, default=default)
-
+from gigamonkeys.montecarlo.serialize import dump
 
 if __name__ == "__main__":
 
@@ -33,6 +22,11 @@ if __name__ == "__main__":
     )
 
     c = Calendar({pendulum.parse("2020-07-03").date()})
-    r = s.run(iters=10, start=c.today(), due_date=c.today().add(days=50), calendar=c)
+    r, _ = s.run(
+        until_precision=1,
+        start=c.today(),
+        due_date=c.today() + datetime.timedelta(days=50),
+        calendar=c,
+    )
 
-    json_dump(asdict(r))
+    dump(r, sys.stdout, indent=2)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# Checks that a seeded run gives the same results whichever engine,
+# number of workers, store, or memo it's run with. Run directly or with
+# pytest.
+
+import random
+from datetime import date
+
+import pytest
+
+from gigamonkeys.montecarlo import Estimate
+from gigamonkeys.montecarlo import Named
+from gigamonkeys.montecarlo import Simulation
+from gigamonkeys.montecarlo import calendar
+from gigamonkeys.montecarlo import deadline
+from gigamonkeys.montecarlo.calendar import Calendar
+from gigamonkeys.montecarlo.columnar import Column
+from gigamonkeys.montecarlo.memo import Memo
+from gigamonkeys.montecarlo.schedule import DAG
+from gigamonkeys.montecarlo.schedule import OneOf
+from gigamonkeys.montecarlo.schedule import Parallel
+from gigamonkeys.montecarlo.schedule import Sequence
+
+iters = 12_000
+
+start = date(2020, 6, 1)
+
+days_off = Calendar({date(2020, 7, 3), date(2020, 6, 15)})
+
+
+class NamedEstimate(Named, Estimate):
+    pass
+
+
+class Uniform(Named, Simulation):
+
+    "A leaf that only implements make_step, stepped one at a time."
+
+    def __init__(self, name, low, high):
+        super().__init__(name=name)
+        self.low = low
+        self.high = high
+
+    def reseed(self, seed, sampler=None):
+        self.rng = random.Random(int(seed.generate_state(1)[0]))
+
+    def make_step(self, **kwds):
+        return self.rng.uniform(self.low, self.high)
+
+
+def shapes(m):
+    "A schedule from module m using each distribution."
+    return m.sequence(
+        "Shapes",
+        [
+            m.estimate("Normal", 5, 10),
+            m.parallel(
+                "Skewed",
+                [
+                    m.estimate("Lognormal", 2, 20, distribution="lognormal"),
+                    m.estimate("Triangular", 3, 9, distribution="triangular"),
+                    m.estimate("PERT", 4, 12, distribution="pert", mode=5),
+                ],
+            ),
+            m.estimate("Short", 0.1, 0.9),
+        ],
+    )
+
+
+def same_everywhere(simulation, **kwds):
+    "Check the runs of simulation all match the scalar engine's."
+    expected = simulation.run(iters, seed=1, **kwds)
+    runs = {
+        "vectorized": dict(engine="vectorized"),
+        "workers": dict(workers=2),
+        "columns": dict(engine="vectorized", store=Column),
+        "memo": dict(engine="vectorized", store=Column, memo=Memo()),
+    }
+    for name, args in runs.items():
+        assert simulation.run(iters, seed=1, **args, **kwds) == expected, name
+
+
+def test_make_step_leaves():
+    for composite in (Sequence, Parallel, OneOf):
+        s = composite(name="Root", children=[Uniform("a", 1, 2), Uniform("b", 1, 3)])
+        scalar = s.simulate(iters, seed=1)
+        vectorized = s.simulate(iters, seed=1, engine="vectorized")
+        assert len(vectorized.own) == iters
+        assert vectorized.own == scalar.own
+        assert s.summarize(vectorized) == s.summarize(scalar)
+
+
+def test_estimates():
+    s = Sequence(
+        name="Root",
+        children=[
+            NamedEstimate(name="a", low=1, high=5),
+            Parallel(
+                name="p",
+                children=[
+                    NamedEstimate(name="b", low=2, high=4, distribution="pert"),
+                    NamedEstimate(name="c", low=1, high=6, distribution="lognormal"),
+                ],
+            ),
+        ],
+    )
+    same_everywhere(s)
+
+
+def test_dag():
+    rng = random.Random(0)
+    tasks = [
+        NamedEstimate(name=f"t{i}", low=1, high=rng.randint(2, 9)) for i in range(60)
+    ]
+    after = {
+        f"t{i}": [f"t{j}" for j in rng.sample(range(i), min(i, rng.randint(0, 3)))]
+        for i in range(1, 60)
+    }
+    same_everywhere(DAG(name="Graph", children=tasks, after=after))
+
+
+def test_until_precision():
+    s = shapes(calendar)
+    kwds = dict(seed=1, start=start, calendar=days_off, until_precision=0.5)
+    summary, iterations = s.run(**kwds)
+    assert 0 < iterations <= 1_000_000
+    assert s.run(iterations, seed=1, start=start, calendar=days_off) == summary
+    assert s.run(workers=2, **kwds) == (summary, iterations)
+    with pytest.raises(ValueError):
+        s.run(iters, **kwds)
+
+
+def test_calendar():
+    same_everywhere(shapes(calendar), start=start, calendar=days_off)
+
+
+def test_deadline():
+    for due in (date(2020, 6, 20), date(2020, 7, 15)):
+        same_everywhere(shapes(deadline), start=start, due_date=due, calendar=days_off)
+
+
+if __name__ == "__main__":
+
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -1,11 +1,39 @@
+from collections import Counter
 from collections import defaultdict
+from collections import deque
 from dataclasses import dataclass
+from datetime import date
 from math import floor
-from random import normalvariate
+from math import sqrt
+from numbers import Real
+from time import perf_counter
+from typing import Dict
 from typing import List
 
-# From https://en.wikipedia.org/wiki/Normal_distribution#Quantile_function
-z_90 = 1.644853626951
+import numpy as np
+
+from gigamonkeys.montecarlo.distributions import shape
+from gigamonkeys.montecarlo.distributions import z_90  # noqa: F401
+from gigamonkeys.montecarlo.sampling import Sampler
+
+# How many values Estimate draws at a time when stepping one by one.
+chunk_size = 1024
+
+# Runs are simulated in batches of this many iterations, each with its
+# own random streams, so the results don't depend on how the batches
+# are spread across worker processes.
+batch_size = 5_000
+
+# Fewest batches to compute a standard error from when running until a
+# given precision.
+min_batches = 4
+
+# Bump whenever a change makes the same run give different results, so
+# results cached by cache.Cache from older versions aren't used.
+engine_version = 2
+
+# Quantiles Simulation.describe gives by default: P10, P50, P80, and P95.
+default_quantiles = (0.1, 0.5, 0.8, 0.95)
 
 
 class Mixin:
@@ -20,9 +48,22 @@ class Simulation(Mixin):
 
     "Base class for simulations."
 
-    def accumulator(self):
-        "Produce an accumulator to hold results of each step."
-        return []
+    def accumulator(self, store=None, record=None):
+        """
+        Produce an accumulator to hold results of each step. By default
+        a list which keeps every value; store, if given, is called to
+        make some other kind of store, such as a sketch.KLL, which
+        keeps a bounded summary instead. If record, a collection of
+        names, is given and we aren't in it, a Null accumulator which
+        keeps nothing.
+        """
+        if not self.recorded(record):
+            return Null()
+        return [] if store is None else store()
+
+    def recorded(self, record):
+        "Whether to keep our values given the names to record, None for all."
+        return record is None or getattr(self, "name", None) in record
 
     def make_step(self, **kwds):
         "Generate one simulated step"
@@ -35,66 +76,332 @@ class Simulation(Mixin):
         accumulator.append(s)
         return s
 
+    def step_batch(self, accumulator, size, **kwds):
+        "Produce size steps at once, add them to the accumulator, and return them."
+        # Simulations that can be vectorized override this. The
+        # fallback is to step one at a time. Numbers are returned as an
+        # array, like vectorized batches, so composites combine them
+        # element by element.
+        steps = [self.step(accumulator, **kwds) for _ in range(size)]
+        if steps and all(isinstance(s, Real) for s in steps):
+            return np.asarray(steps)
+        return steps
+
+    def accumulate_batch(self, accumulator, batch):
+        "Add a batch of step values to the accumulator."
+        if isinstance(batch, np.ndarray) and not getattr(
+            accumulator, "takes_arrays", False
+        ):
+            batch = batch.tolist()
+        accumulator.extend(batch)
+
+    def reseed(self, seed, sampler=None):
+        """
+        Reset any random streams from the given numpy SeedSequence,
+        getting them from sampler, a sampling.Sampler, if given.
+        """
+
     def summarize(self, accumulator):
         "Summarize the accumulated values."
         return self.confidence_interval(accumulator)
 
-    def run(self, iters, **kwds):
-        "Simulate by producing and accumulating iters steps."
-        acc = self.accumulator()
-        for _ in range(iters):
-            self.step(acc, **kwds)
-        return self.summarize(acc)
+    def merge(self, accumulator, other):
+        "Merge the values accumulated in other into accumulator."
+        if isinstance(accumulator, list):
+            accumulator.extend(other)
+        else:
+            accumulator.merge(other)
+
+    def run(self, iters=None, **kwds):
+        """
+        Simulate by producing and accumulating iters steps and
+        summarize the result. See simulate for the options; with
+        until_precision, returns the summary and the number of
+        iterations it took.
+        """
+        if kwds.get("until_precision") is not None:
+            accumulator, iterations = self.simulate(iters, **kwds)
+            return self.summarized(accumulator, kwds.get("profile")), iterations
+        return self.summarized(self.simulate(iters, **kwds), kwds.get("profile"))
+
+    def summarized(self, accumulator, profile):
+        "Summarize accumulator, timing it into profile if given."
+        if profile is None:
+            return self.summarize(accumulator)
+
+        start = perf_counter()
+        summary = self.summarize(accumulator)
+        profile.summarize_seconds += perf_counter() - start
+        return summary
+
+    def simulate(
+        self,
+        iters=None,
+        engine="scalar",
+        seed=None,
+        store=None,
+        record=None,
+        memo=None,
+        profile=None,
+        workers=None,
+        sampling="random",
+        until_precision=None,
+        max_iters=1_000_000,
+        **kwds,
+    ):
+        """
+        Simulate iters steps and return the accumulator. Any keyword
+        args other than these options are passed along to step.
+
+        The scalar engine steps one iteration at a time; the vectorized
+        engine steps a whole batch at once as arrays. Both draw from
+        the same random streams so, given the same seed, they produce
+        the same values. Either way the tree is first compiled to a
+        flat plan.Plan rather than stepped recursively. See accumulator
+        for store and record and sampling.Sampler for sampling.
+
+        If record is given only the nodes with those names, plus the
+        root, keep their values; the rest are still simulated but
+        summarize to None.
+
+        If memo, a memo.Memo, is given, the values of subtrees are
+        looked up in it, batch by batch, rather than re-simulated if
+        nothing they depend on has changed since they were added. That
+        needs an explicit seed, the vectorized engine, and no workers,
+        and pays off most with store=columnar.Column since merging
+        lists of values costs about as much as simulating them.
+
+        If profile, an instrument.Profile, is given, it records the
+        time, draws, and memory of each node and the whole run. That
+        needs no workers.
+
+        If workers is given, the batches are simulated in that many
+        processes and their accumulators merged, in order, afterwards;
+        this requires the simulation, the store, and the keyword args
+        to be picklable. Either way the result for a given seed is the
+        same.
+
+        If until_precision is given instead of iters, batches are
+        simulated until the batch means standard error of both bounds
+        of our own interval is within until_precision, or max_iters is
+        reached, and both the accumulator and the number of iterations
+        actually simulated are returned.
+        """
+        if (iters is None) == (until_precision is None):
+            raise ValueError("Need either iters or until_precision, not both")
+        limit = iters if until_precision is None else max_iters
+        if memo is not None and (engine != "vectorized" or workers is not None):
+            raise ValueError("memo needs the vectorized engine and no workers")
+        if memo is not None and seed is None:
+            raise ValueError("memo needs an explicit seed")
+        if memo is not None:
+            memo.begin()
+        if profile is not None:
+            if workers is not None:
+                raise ValueError("profile needs no workers")
+            profile.start(self)
+            start = perf_counter()
+        if record is not None and hasattr(self, "name"):
+            record = {*record, self.name}
+        seeds = np.random.SeedSequence(seed)
+        batches = (
+            (spawn(seeds, i), min(batch_size, limit - start))
+            for i, start in enumerate(range(0, limit, batch_size))
+        )
+        acc = self.accumulator(store, record)
+        intervals = []
+        iterations = 0
+        for size, batch in self.simulate_batches(
+            batches, workers, engine, store, record, memo, profile, sampling, kwds
+        ):
+            self.merge(acc, batch)
+            iterations += size
+            if until_precision is not None:
+                intervals.append(self.interval(batch))
+                if converged(intervals, until_precision):
+                    break
+        if profile is not None:
+            profile.finish(self, acc, iterations, perf_counter() - start)
+        return acc if until_precision is None else (acc, iterations)
+
+    def simulate_batches(
+        self, batches, workers, engine, store, record, memo, profile, sampling, kwds
+    ):
+        "Generate the size and accumulator of each batch, in order."
+        if workers is None:
+            for seed, size in batches:
+                yield size, self.simulate_batch(
+                    seed,
+                    size,
+                    engine,
+                    store,
+                    record,
+                    sampling,
+                    memo=memo,
+                    profile=profile,
+                    **kwds,
+                )
+        else:
+            # Only runs with workers need it, and it's slow to import.
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_init_worker,
+                initargs=(self, engine, store, record, sampling, kwds),
+            ) as pool:
+                # Only keep a few batches in flight in case we stop early.
+                pending = deque()
+                for batch in batches:
+                    pending.append((batch[1], pool.submit(_simulate_batch, batch)))
+                    if len(pending) >= 2 * workers:
+                        size, future = pending.popleft()
+                        yield size, future.result()
+                for size, future in pending:
+                    yield size, future.result()
+
+    def simulate_batch(
+        self,
+        seed,
+        size,
+        engine,
+        store,
+        record,
+        sampling,
+        memo=None,
+        profile=None,
+        **kwds,
+    ):
+        "Simulate one batch of size steps from seed and return its accumulator."
+        # plan imports this module.
+        from gigamonkeys.montecarlo.plan import compile
+
+        self.reseed(seed, Sampler(sampling, size))
+        acc = self.accumulator(store, record)
+        plan = compile(self)
+        if engine == "scalar":
+            plan.step_each(acc, size, profile=profile, **kwds)
+        elif engine == "vectorized":
+            scope = None if memo is None else memo.scope(store, record)
+            plan.step_batch(acc, size, memo=scope, profile=profile, **kwds)
+        else:
+            raise ValueError(f"Unknown engine {engine}")
+        if profile is not None:
+            profile.count_draws(self)
+        return acc
+
+    def interval(self, accumulator):
+        "The interval, in days, of our own values, used to judge convergence."
+        return self.confidence_interval(accumulator)
 
     def confidence_interval(self, values, p=0.9):
         "Compute a confidence interval from a set of sortable values."
         if not values:
             return None
 
-        ordered = sorted(values)
-        size = len(ordered)
+        size = len(values)
         outside = (1 - p) / 2
-        return (ordered[floor(size * outside)], ordered[floor(size * 1 - outside)])
+        return tuple(select(values, [rank(size, outside), rank(size, 1 - outside)]))
+
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        """
+        Like summarize but with the values at each of the quantiles ps,
+        the mean, and a histogram, per Distribution, of each kind of
+        value rather than just the confidence interval.
+        """
+        return distribution(accumulator, ps, bins)
 
     def categorical(self, values):
-        "Return proportion of each of the values in a list."
-        counts = defaultdict(float)
-        total = 0
-        for x in values:
-            counts[x] += 1
-            total += 1
+        "Return proportion of each of the values in a list or Tally."
+        if isinstance(values, Counter):
+            counts = values
+            total = sum(values.values())
+        else:
+            counts = defaultdict(float)
+            total = 0
+            for x in values:
+                counts[x] += 1
+                total += 1
         return {k: v / total for k, v in counts.items()}
 
 
 class Estimate(Simulation):
 
     """
-    A direct estimate. Simulated by generating random normal values
-    such that 90% of the values will fall within the bounds of the
-    estimate.
+    A direct estimate. Simulated by generating random values such that
+    90% of the values will fall within the bounds of the estimate. The
+    values are normal unless distribution names another shape from
+    distributions.shapes: "lognormal", "triangular", or "pert", the
+    last two peaking at mode. If sampling is given it overrides the
+    run's sampling method for this estimate.
     """
 
-    def __init__(self, low, high, lowest=float("-inf"), highest=float("inf"), **kwds):
-        super().__init__(low=low, high=high, lowest=lowest, highest=highest, **kwds)
-
-        # 90% of normal values will fall within +/- ~1.64 standard
-        # deviations of the mean. We want 90% of values to fall
-        # between low and high, so we want to back out the desired
-        # standard deviation such that 1.64 standard deviations is the
-        # distance from mid to high (or to low).
-
-        half_width = (high - low) / 2
-        mid = low + half_width
-        stddev = half_width / z_90
-
-        def value():
-            return min(max(normalvariate(mid, stddev), lowest), highest)
-
-        self.values = iter(value, None)
+    def __init__(
+        self,
+        low,
+        high,
+        lowest=float("-inf"),
+        highest=float("inf"),
+        sampling=None,
+        distribution="normal",
+        mode=None,
+        **kwds,
+    ):
+        super().__init__(
+            low=low,
+            high=high,
+            lowest=lowest,
+            highest=highest,
+            sampling=sampling,
+            distribution=distribution,
+            mode=mode,
+            **kwds,
+        )
+        self.shape = shape(distribution, low, high, mode)
+        self.lowest = lowest
+        self.highest = highest
+        self.sampling = sampling
+        self.reseed(np.random.SeedSequence())
+
+    def reseed(self, seed, sampler=None):
+        if sampler is None:
+            sampler = Sampler("random", chunk_size)
+        self.seed = seed
+        self.stream = sampler.stream(np.random.default_rng(seed), self.sampling)
+
+        # Single steps are handed out from draws the size of a whole
+        # batch so they come out identical to stepping the batch at
+        # once.
+        def values():
+            while True:
+                yield from self.sample(sampler.size).tolist()
+
+        self.values = values()
+
+    def __getstate__(self):
+        # Generators can't be pickled so we get a new one when unpickled.
+        state = dict(self.__dict__)
+        del state["values"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reseed(np.random.SeedSequence())
+
+    def sample(self, size):
+        "Draw size clamped values as an array."
+        values = self.shape.draw(self.stream, size)
+        self.stream.draws += size
+        return np.clip(values, self.lowest, self.highest)
 
     def make_step(self, **kwds):
         return next(self.values)
 
+    def step_batch(self, accumulator, size, **kwds):
+        b = self.sample(size)
+        self.accumulate_batch(accumulator, b)
+        return b
+
 
 class CompositeSimulation(Simulation):
 
@@ -107,12 +414,32 @@ class CompositeSimulation(Simulation):
     def combine_child_values(self, child_values):
         "Combine children's step values into our step value."
 
+    def next_kwds(self, kwds, value):
+        """
+        The keyword args to step the next child with, given the args
+        the last child was stepped with and its value. By default all
+        children are stepped with the same args.
+        """
+        return kwds
+
+    def next_kwds_batch(self, kwds, batch):
+        "Like next_kwds but given the last child's batch."
+        return kwds
+
     def step_children(self, accumulators, **kwds):
         "Step our children and return the result."
-        return [c.step(a, **kwds) for c, a in zip(self.children, accumulators)]
-
-    def accumulator(self):
-        return Composite([], [c.accumulator() for c in self.children])
+        values = []
+        for c, a in zip(self.children, accumulators):
+            v = c.step(a, **kwds)
+            kwds = self.next_kwds(kwds, v)
+            values.append(v)
+        return values
+
+    def accumulator(self, store=None, record=None):
+        return Composite(
+            super().accumulator(store, record),
+            [c.accumulator(store, record) for c in self.children],
+        )
 
     def step(self, accumulator, **kwds):
         child_values = self.step_children(accumulator.children, **kwds)
@@ -120,12 +447,52 @@ class CompositeSimulation(Simulation):
         accumulator.own.append(s)
         return s
 
+    def combine_child_batches(self, child_batches):
+        "Combine children's batches of step values into our batch."
+        return [self.combine_child_values(list(vs)) for vs in zip(*child_batches)]
+
+    def step_children_batch(self, accumulators, size, **kwds):
+        "Step our children a batch at a time and return their batches."
+        batches = []
+        for c, a in zip(self.children, accumulators):
+            b = c.step_batch(a, size, **kwds)
+            kwds = self.next_kwds_batch(kwds, b)
+            batches.append(b)
+        return batches
+
+    def step_batch(self, accumulator, size, **kwds):
+        child_batches = self.step_children_batch(accumulator.children, size, **kwds)
+        b = self.combine_child_batches(child_batches)
+        self.accumulate_batch(accumulator.own, b)
+        return b
+
+    def reseed(self, seed, sampler=None):
+        for i, c in enumerate(self.children):
+            c.reseed(spawn(seed, i), sampler)
+
+    def interval(self, accumulator):
+        return super().interval(accumulator.own)
+
+    def merge(self, accumulator, other):
+        super().merge(accumulator.own, other.own)
+        for c, a, o in zip(self.children, accumulator.children, other.children):
+            c.merge(a, o)
+
     def summarize(self, accumulator):
         return Composite(
             super().summarize(accumulator.own),
             [c.summarize(a) for c, a in zip(self.children, accumulator.children)],
         )
 
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        return Composite(
+            super().describe(accumulator.own, ps, bins),
+            [
+                c.describe(a, ps, bins)
+                for c, a in zip(self.children, accumulator.children)
+            ],
+        )
+
 
 class Named(Mixin):
     def __init__(self, name, **kwds):
@@ -136,6 +503,94 @@ class Named(Mixin):
     def summarize(self, accumulator):
         return NamedSummary(self.name, super().summarize(accumulator))
 
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        return NamedSummary(self.name, super().describe(accumulator, ps, bins))
+
+
+# Worker process state for Simulation.simulate.
+_worker = None
+
+
+def _init_worker(simulation, engine, store, record, sampling, kwds):
+    global _worker
+    _worker = (simulation, engine, store, record, sampling, kwds)
+
+
+def _simulate_batch(batch):
+    simulation, engine, store, record, sampling, kwds = _worker
+    seed, size = batch
+    return simulation.simulate_batch(
+        seed, size, engine, store, record, sampling, **kwds
+    )
+
+
+def converged(intervals, precision):
+    "Whether the batch means standard errors of both bounds are within precision."
+    intervals = [i for i in intervals if i is not None]
+    if len(intervals) < min_batches:
+        return False
+    bounds = np.array(intervals, dtype=float)
+    errors = bounds.std(axis=0, ddof=1) / sqrt(len(bounds))
+    return bool((errors <= precision).all())
+
+
+def select(values, ranks):
+    "The values at the given ranks, as if sorted, from a list or a store."
+    if isinstance(values, list):
+        array = np.asarray(values)
+        if array.dtype == object:
+            ordered = sorted(values)
+            return [ordered[r] for r in ranks]
+        # Partial selection is linear rather than n log n.
+        return np.partition(array, ranks)[ranks].tolist()
+    else:
+        return values.select(ranks)
+
+
+def rank(size, p):
+    "The rank of the p quantile of size values."
+    return min(floor(size * p), size - 1)
+
+
+def distribution(values, ps=default_quantiles, bins=10):
+    """
+    Describe values, from a list or a store, with a Distribution, or
+    None if there are none. The values are gathered into one array and
+    all the quantiles found with one partial selection. Dates, in a
+    list or a Dates store, are described with dates.
+    """
+    if not len(values):
+        return None
+    if isinstance(values, list) and isinstance(values[0], date):
+        values = Dates([d.toordinal() for d in values])
+    if isinstance(values, Dates):
+        return distribution(values.store, ps, bins).map(
+            lambda x: date.fromordinal(int(round(x)))
+        )
+
+    ranks = [rank(len(values), p) for p in ps]
+    if hasattr(values, "weighted"):
+        # Sketches hold a sample of values, each standing in for several.
+        array, weights = values.weighted()
+        quantiles = values.select(ranks)
+    else:
+        array = np.asarray(values if isinstance(values, list) else values.values)
+        weights = None
+        quantiles = np.partition(array, ranks)[ranks].tolist()
+    counts, edges = np.histogram(array, bins, weights=weights)
+    return Distribution(
+        dict(zip(ps, quantiles)),
+        float(np.average(array, weights=weights)),
+        Histogram(edges.tolist(), counts.tolist()),
+    )
+
+
+def spawn(seed, i):
+    "The SeedSequence for the i-th child of seed."
+    # Derived by position rather than with seed.spawn() so reseeding
+    # with the same seed always gives each child the same stream.
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,))
+
 
 @dataclass
 class Composite:
@@ -148,3 +603,154 @@ class Composite:
 class NamedSummary:
     name: str
     summary: object
+
+
+@dataclass
+class Histogram:
+    "Counts of values between each pair of consecutive edges."
+    edges: List[object]
+    counts: List[float]
+
+
+@dataclass
+class Distribution:
+    "Values at some quantiles, the mean, and a histogram of a set of values."
+    quantiles: Dict[float, object]
+    mean: object
+    histogram: Histogram
+
+    def map(self, f):
+        "The same distribution with f applied to each value."
+        return Distribution(
+            {p: f(x) for p, x in self.quantiles.items()},
+            f(self.mean),
+            Histogram([f(e) for e in self.histogram.edges], self.histogram.counts),
+        )
+
+
+class Record:
+
+    """
+    Accumulate record-like steps, e.g. CalendarSteps, with one store
+    per attribute so each can be summarized on its own. Dates are kept
+    as ordinals and categories are counted exactly; None values are
+    skipped.
+    """
+
+    def __init__(self, store, keys, dates=(), categories=()):
+        def column(key):
+            if key in categories:
+                return Tally()
+            elif key in dates:
+                return Dates(store())
+            else:
+                return store()
+
+        self.columns = {key: column(key) for key in keys}
+
+    def append(self, step):
+        for key, column in self.columns.items():
+            value = getattr(step, key)
+            if value is not None:
+                column.append(value)
+
+    def extend(self, steps):
+        for step in steps:
+            self.append(step)
+
+    def extend_columns(self, columns):
+        """
+        Add a batch of steps given as a dict of per-key arrays, with
+        dates as ordinals and None values already left out.
+        """
+        for key, values in columns.items():
+            column = self.columns[key]
+            if isinstance(column, Dates):
+                column = column.store
+            column.extend(values.tolist() if isinstance(values, np.ndarray) else values)
+
+    def extend_batch(self, batch):
+        self.extend_columns(batch.columns())
+
+    def merge(self, other):
+        for key, column in self.columns.items():
+            column.merge(other.columns[key])
+
+    def column(self, key):
+        "The store of one attribute's values, for summarizing."
+        return self.columns[key]
+
+
+def records(store, keys, dates=(), categories=(), integers=()):
+    """
+    An accumulator for record-like steps with the given keys: a Record
+    using store for each attribute unless store makes its own kind,
+    e.g. columnar.Column. Categories map to their possible labels.
+    Stores that keep types can keep integers as such.
+    """
+    if hasattr(store, "records"):
+        return store.records(keys, dates, categories, integers)
+    else:
+        return Record(store, keys, dates, categories)
+
+
+class Dates:
+
+    "Store dates as ordinals in some other store."
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def append(self, d):
+        self.store.append(d.toordinal())
+
+    def extend(self, ds):
+        self.store.extend(d.toordinal() for d in ds)
+
+    def merge(self, other):
+        self.store.merge(other.store)
+
+    def select(self, ranks):
+        return [date.fromordinal(int(o)) for o in select(self.store, ranks)]
+
+
+class Null:
+
+    "Accumulator for the values of nodes we aren't recording."
+
+    takes_arrays = True
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+    def append(self, x):
+        pass
+
+    def extend(self, xs):
+        pass
+
+    def extend_batch(self, batch):
+        pass
+
+    def merge(self, other):
+        pass
+
+
+class Tally(Counter):
+
+    "Exact counts of categorical values."
+
+    def append(self, x):
+        self[x] += 1
+
+    def extend(self, xs):
+        self.update(xs)
+
+    def merge(self, other):
+        self.update(other)
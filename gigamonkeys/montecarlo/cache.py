@@ -0,0 +1,103 @@
+# A cache of the results of runs in files on disk, so re-running the
+# same simulation with the same args, e.g. from the same schedule file
+# many times a day, returns the saved summary instead of re-simulating.
+
+import os
+import pickle
+from tempfile import NamedTemporaryFile
+
+from gigamonkeys.montecarlo import engine_version
+from gigamonkeys.montecarlo.memo import Uncacheable
+from gigamonkeys.montecarlo.memo import canonical
+from gigamonkeys.montecarlo.memo import digest
+from gigamonkeys.montecarlo.memo import fingerprint
+
+# Args of run that don't change its result.
+ignored = ("memo", "workers")
+
+
+class Cache:
+
+    """
+    The results returned by Simulation.run, including the number of
+    iterations of runs until_precision, pickled into directory and
+    keyed by the content of the simulation tree, the args of the run,
+    and the engine_version. Holds up to about max_bytes, evicting
+    the least recently used results first.
+
+    Only runs with an explicit seed are cached since the others are
+    meant to differ. Neither are profiled runs nor runs with args, such
+    as a lambda store, that memo.canonical can't identify.
+    """
+
+    suffix = ".pickle"
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, simulation, iters=None, **kwds):
+        "Like simulation.run(iters, **kwds) but cached."
+        # Profiled runs are run so the profile gets filled in.
+        if kwds.get("seed") is None or kwds.get("profile") is not None:
+            return simulation.run(iters, **kwds)
+
+        try:
+            path = self.path(simulation, iters, kwds)
+        except Uncacheable:
+            return simulation.run(iters, **kwds)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+        else:
+            self.hits += 1
+            # Mark it recently used.
+            os.utime(path)
+            return result
+
+        result = simulation.run(iters, **kwds)
+        self.put(path, result)
+        return result
+
+    def path(self, simulation, iters, kwds):
+        args = {k: v for k, v in kwds.items() if k not in ignored}
+        key = digest((engine_version, iters, fingerprint(simulation), canonical(args)))
+        return os.path.join(self.directory, key + self.suffix)
+
+    def put(self, path, result):
+        # Write to a temporary file and rename it into place so readers,
+        # including other processes, never see half a result.
+        with NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+        self.evict()
+
+    def entries(self):
+        "The path, size, and last use of each cached result."
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith(self.suffix):
+                    stat = e.stat()
+                    yield e.path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        "Remove the least recently used results until we fit in max_bytes."
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path, _, _ in list(self.entries()):
+            os.remove(path)
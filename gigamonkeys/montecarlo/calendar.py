@@ -1,27 +1,58 @@
+from bisect import bisect_left
+from bisect import bisect_right
 from dataclasses import dataclass
 from dataclasses import field
 from datetime import date
+from datetime import timedelta
+from functools import partial
+from functools import reduce
+from operator import add
 
-import pendulum
+import numpy as np
 
 from gigamonkeys.montecarlo import CompositeSimulation
 from gigamonkeys.montecarlo import Estimate
 from gigamonkeys.montecarlo import Named
+from gigamonkeys.montecarlo import Null
 from gigamonkeys.montecarlo import Simulation
+from gigamonkeys.montecarlo import default_quantiles
+from gigamonkeys.montecarlo import distribution
+from gigamonkeys.montecarlo import records
 
 
 class Calendar:
 
-    "Keep track of weekdays and days off."
+    """
+    Keep track of weekdays and days off. Works on datetime.dates, or
+    subclasses such as pendulum's, and the batch methods on ordinals.
+    The days off are a frozenset, so to change them assign a new
+    collection to days_off rather than adding to it.
+    """
 
     def __init__(self, days_off):
         self.days_off = days_off
 
+    @property
+    def days_off(self):
+        return self._days_off
+
+    @days_off.setter
+    def days_off(self, days_off):
+        # Kept sorted so days_off_between can bisect rather than scan.
+        # Frozen so the index can't silently go stale.
+        self._days_off = frozenset(days_off)
+        self.sorted_days_off = tuple(sorted(self._days_off))
+        self.days_off_ordinals = np.array(
+            [d.toordinal() for d in self.sorted_days_off], dtype=np.int64
+        )
+        self.days_off_ordinals.flags.writeable = False
+
     def today(self):
-        return pendulum.today().date()
+        return date.today()
 
     def n_workdays_after(self, start, days):
         "The end date days workdays after start."
+        end = start
         new_start = start
         days_left = days
         while days_left > 0:
@@ -42,14 +73,80 @@ class Calendar:
         else:
             weekend_days = 7 - start.weekday()
 
-        return start.add(weeks=whole_weeks, days=extra_days + weekend_days)
+        return start + timedelta(weeks=whole_weeks, days=extra_days + weekend_days)
 
     def days_off_between(self, start, end):
-        return sum(start <= d <= end for d in self.days_off)
+        "The number of days off from start to end, inclusive."
+        days_off = self.sorted_days_off
+        return max(bisect_right(days_off, end) - bisect_left(days_off, start), 0)
+
+    # Batch versions of the above working on arrays of date ordinals
+    # and giving the same results, date for date.
+
+    def n_workdays_after_batch(self, start, days):
+        "The end ordinals days workdays after the start ordinals."
+        end = start.copy()
+        new_start = start.copy()
+        days_left = np.array(days, dtype=float)
+        left = days_left > 0
+        while left.any():
+            e = self.n_weekdays_after_batch(new_start[left], days_left[left])
+            end[left] = e
+            days_left[left] = self.days_off_between_batch(new_start[left], e)
+            new_start[left] = e
+            left = days_left > 0
+        return end
+
+    def n_weekdays_after_batch(self, start, days):
+        whole_weeks, extra_days = np.divmod(days, 5)
+        weekday = (start + 6) % 7
+        into_weekend = weekday + extra_days > 4
+        weekend_days = np.where(into_weekend, np.where(weekday < 5, 2, 7 - weekday), 0)
+        # Whole days the way date + timedelta(days=...) counts them,
+        # i.e. rounded to the microsecond and then floored.
+        offset = (extra_days + weekend_days) + whole_weeks * 7
+        microseconds = np.round(offset * microseconds_per_day)
+        return start + (microseconds // microseconds_per_day).astype(np.int64)
+
+    def days_off_between_batch(self, start, end):
+        days_off = self.days_off_ordinals
+        n = np.searchsorted(days_off, end, "right") - np.searchsorted(days_off, start)
+        return np.maximum(n, 0)
+
+
+microseconds_per_day = 24 * 60 * 60 * 1_000_000
+
+
+def ordinals(d, size):
+    "A date as an array of size ordinals, or an array of ordinals as is."
+    if isinstance(d, date):
+        return np.full(size, d.toordinal(), dtype=np.int64)
+    else:
+        return d
+
+
+def dates(*ordinal_arrays):
+    "A dict from each of the ordinals in the arrays to its date."
+    return {o: date.fromordinal(o) for o in np.unique(ordinal_arrays).tolist()}
 
 
-def estimate(name, low, high):
-    return CalendarEstimate(name=name, low=low, high=high)
+def parse_date(s):
+    """
+    Parse an ISO date, e.g. 2020-06-01, or any other format pendulum
+    can parse if it's installed.
+    """
+    try:
+        return date.fromisoformat(s)
+    except ValueError:
+        try:
+            import pendulum
+        except ImportError:
+            raise ValueError(f"Not an ISO date: {s}")
+        return pendulum.parse(s).date()
+
+
+def estimate(name, low, high, **kwds):
+    return CalendarEstimate(name=name, low=low, high=high, **kwds)
 
 
 def sequence(name, children):
@@ -61,11 +158,53 @@ def parallel(name, children):
 
 
 class CalendarSummarizer(Simulation):
+
+    keys = ("days", "calendar_days", "start", "end")
+
+    # Attributes of the steps that are labels, with their possible labels.
+    categories = {}
+
+    def accumulator(self, store=None, record=None):
+        if not self.recorded(record):
+            return Null()
+        elif store is None:
+            return []
+        else:
+            return records(
+                store,
+                self.keys + tuple(self.categories),
+                dates=("start", "end"),
+                categories=self.categories,
+                integers=("calendar_days",),
+            )
+
+    def column(self, accumulator, key):
+        "The values of one attribute of the accumulated steps."
+        if isinstance(accumulator, list):
+            return [getattr(a, key) for a in accumulator]
+        else:
+            return accumulator.column(key)
+
     def summarize(self, accumulator):
-        return {
-            key: self.confidence_interval([getattr(a, key) for a in accumulator])
-            for key in ("days", "calendar_days", "start", "end")
-        }
+        return self.by_key(accumulator, self.confidence_interval)
+
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        return self.by_key(accumulator, partial(distribution, ps=ps, bins=bins))
+
+    def by_key(self, accumulator, f):
+        "A dict of f of the values of each key, or None if none were kept."
+        if isinstance(accumulator, Null):
+            return None
+        return {key: f(self.column(accumulator, key)) for key in self.keys}
+
+    def interval(self, accumulator):
+        return self.confidence_interval(self.column(accumulator, "calendar_days"))
+
+    def accumulate_batch(self, accumulator, batch):
+        if isinstance(accumulator, list):
+            accumulator.extend(batch.steps())
+        else:
+            accumulator.extend_batch(batch)
 
 
 class CalendarEstimate(Named, CalendarSummarizer, Estimate):
@@ -74,6 +213,13 @@ class CalendarEstimate(Named, CalendarSummarizer, Estimate):
         end = calendar.n_workdays_after(start, days)
         return CalendarStep(days, start, end)
 
+    def step_batch(self, accumulator, size, start=None, calendar=None, **kwds):
+        days = self.sample(size)
+        start = ordinals(start, size)
+        b = CalendarBatch(days, start, calendar.n_workdays_after_batch(start, days))
+        self.accumulate_batch(accumulator, b)
+        return b
+
 
 class CalendarComposite(Named, CompositeSimulation, CalendarSummarizer):
     pass
@@ -83,24 +229,32 @@ class CalendarSequence(CalendarComposite):
 
     "Like Sequence except date aware."
 
-    def step_children(self, accumulators, start=None, calendar=None, **kwds):
-
-        next_start = start
+    def next_kwds(self, kwds, value):
+        return {**kwds, "start": value.end}
 
-        def step(c, a):
-            nonlocal next_start
-            v = c.step(a, start=next_start, calendar=calendar, **kwds)
-            next_start = v.end
-            return v
-
-        return [step(c, a) for c, a in zip(self.children, accumulators)]
+    def next_kwds_batch(self, kwds, batch):
+        return {**kwds, "start": batch.end}
 
     def combine_child_values(self, child_values):
-        days = sum(c.days for c in child_values)
+        days = total_days(child_values)
         start = child_values[0].start
         end = child_values[-1].end
         return CalendarStep(days, start, end)
 
+    def combine_child_batches(self, child_batches):
+        days = total_days(child_batches)
+        start = child_batches[0].start
+        end = child_batches[-1].end
+        return CalendarBatch(days, start, end)
+
+
+def total_days(children):
+    """
+    The days of children done in sequence, as values or batches, added
+    left to right, like Sequence, so batches match values exactly.
+    """
+    return reduce(add, (c.days for c in children))
+
 
 class CalendarParallel(CalendarComposite):
 
@@ -112,6 +266,12 @@ class CalendarParallel(CalendarComposite):
         end = max(c.end for c in child_values)
         return CalendarStep(days, start, end)
 
+    def combine_child_batches(self, child_batches):
+        days = np.maximum.reduce([c.days for c in child_batches])
+        start = child_batches[0].start
+        end = np.maximum.reduce([c.end for c in child_batches])
+        return CalendarBatch(days, start, end)
+
 
 @dataclass
 class CalendarStep:
@@ -125,18 +285,46 @@ class CalendarStep:
         self.calendar_days = (self.end - self.start).days
 
 
+@dataclass
+class CalendarBatch:
+
+    "A batch of CalendarSteps as arrays, with dates as ordinals."
+
+    days: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    def columns(self):
+        return {
+            "days": self.days,
+            "calendar_days": self.end - self.start,
+            "start": self.start,
+            "end": self.end,
+        }
+
+    def table(self):
+        "Aligned columns, one value per step, as kept by columnar.Table."
+        return self.columns()
+
+    def steps(self):
+        # A generator so nothing is built for a Null accumulator.
+        d = dates(self.start, self.end)
+        for days, start, end in zip(
+            self.days.tolist(), self.start.tolist(), self.end.tolist()
+        ):
+            yield CalendarStep(days, d[start], d[end])
+
+
 if __name__ == "__main__":
 
     c = Calendar(set())
 
-    start = pendulum.parse("2020-06-29").date()
+    start = date(2020, 6, 29)
+    week = [start + timedelta(days=d) for d in range(7)]
 
-    starts = "".join(f"{start.add(days=d).format('dddd'):12}" for d in range(7))
+    starts = "".join(f"{d:%A}".ljust(12) for d in week)
     padding = " " * len(f"{9:2d} days after: ")
     print(f"{padding}{starts}")
     for i in range(16):
-        ends = "".join(
-            f"{c.n_weekdays_after(start.add(days=d), i).format('dddd'):12}"
-            for d in range(7)
-        )
+        ends = "".join(f"{c.n_weekdays_after(d, i):%A}".ljust(12) for d in week)
         print(f"{i:2d} days after: {ends}")
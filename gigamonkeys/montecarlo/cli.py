@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Simulate many schedules in one process, e.g. every team's schedule in
+# a nightly job, writing one line of JSON per schedule as soon as it's
+# done. Schedules are schedule DSL files named on the command line or,
+# with none, requests read from stdin, one JSON object per line, as for
+# the service:
+#
+#   python -m gigamonkeys.montecarlo.cli --kind deadline \
+#       --start 2020-06-01 --due-date 2020-07-01 \
+#       --holidays holidays.txt team-*.txt > results.jsonl
+#
+#   python -m gigamonkeys.montecarlo.cli --workers 4 < requests.jsonl
+#
+# The command line options are defaults for every request, which can
+# override them. A schedule file's id is its path. A holidays file has
+# one ISO date per line and the calendar it makes is built once and
+# shared by all the requests that use it. With more than one worker,
+# requests run in parallel and results may come out of order.
+
+import argparse
+import json
+import sys
+
+from gigamonkeys.montecarlo.service import failure
+from gigamonkeys.montecarlo.service import response
+from gigamonkeys.montecarlo.service import run
+
+
+def requests(args, defaults):
+    "Generate the requests from the files in args or else from stdin."
+    if args.files:
+        for path in args.files:
+            with open(path) as f:
+                yield {**defaults, "id": path, "schedule": f.read()}
+    else:
+        for line in sys.stdin:
+            if line.strip():
+                try:
+                    yield {**defaults, **json.loads(line)}
+                except ValueError as e:
+                    yield e
+
+
+def answer(request):
+    """
+    Whether request, which is an exception if it couldn't be read,
+    succeeded and the reply line to it.
+    """
+    try:
+        if isinstance(request, Exception):
+            raise request
+        return True, response(request, run(request))
+    except Exception as e:
+        return False, failure(request, e)
+
+
+def answers(requests, workers):
+    "Generate the reply to each request as it's done."
+    if workers == 1:
+        yield from map(answer, requests)
+    else:
+        # Only needed with several workers, and slow to import.
+        from concurrent.futures import FIRST_COMPLETED
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures import wait
+
+        with ProcessPoolExecutor(workers) as pool:
+            # Keep a few requests queued for each worker, not all of
+            # them, so replies start coming as soon as the first is done.
+            running = set()
+            for request in requests:
+                running.add(pool.submit(answer, request))
+                if len(running) >= 2 * workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    yield from (f.result() for f in done)
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done)
+
+
+def holidays(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many schedules.")
+    parser.add_argument("files", nargs="*", help="schedule DSL files")
+    parser.add_argument("--kind", choices=["calendar", "deadline"])
+    parser.add_argument("--start", help="start date")
+    parser.add_argument("--due-date", help="due date, for deadline schedules")
+    parser.add_argument("--holidays", help="file of days off, one per line")
+    parser.add_argument("--iters", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--engine", choices=["scalar", "vectorized"])
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    args = parser.parse_args(argv)
+
+    defaults = {
+        "kind": args.kind,
+        "start": args.start,
+        "due_date": args.due_date,
+        "iters": args.iters,
+        "seed": args.seed,
+        "engine": args.engine,
+    }
+    defaults = {k: v for k, v in defaults.items() if v is not None}
+    if args.holidays:
+        defaults["holidays"] = holidays(args.holidays)
+
+    ok = True
+    for succeeded, line in answers(requests(args, defaults), args.workers):
+        ok &= succeeded
+        print(line, flush=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# Columnar stores which keep every value in numpy arrays rather than
+# lists of Python objects, and saving them to .npy files that can be
+# reopened memory-mapped. Pass Column as the store argument to
+# Simulation.simulate; nodes with record-like steps, such as calendar
+# and deadline nodes, get a Table.
+
+import json
+import os
+
+import numpy as np
+
+from gigamonkeys.montecarlo import CompositeSimulation
+from gigamonkeys.montecarlo import Dates
+from gigamonkeys.montecarlo import Tally
+
+
+class Column:
+
+    "A growable numpy array holding every value, in order."
+
+    # Simulation.accumulate_batch needn't convert arrays to lists for us.
+    takes_arrays = True
+
+    def __init__(self, dtype=float):
+        self.data = np.empty(1024, dtype=dtype)
+        self.n = 0
+
+    @classmethod
+    def of(cls, values):
+        column = cls(np.asarray(values).dtype)
+        column.extend(values)
+        return column
+
+    @classmethod
+    def records(cls, keys, dates=(), categories=(), integers=()):
+        "The store for record-like steps."
+        return Table(keys, dates, categories, integers)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def values(self):
+        return self.data[: self.n]
+
+    def reserve(self, n):
+        if self.n + n > len(self.data):
+            data = np.empty(max(2 * len(self.data), self.n + n), dtype=self.data.dtype)
+            data[: self.n] = self.values
+            self.data = data
+
+    def append(self, x):
+        self.reserve(1)
+        self.data[self.n] = x
+        self.n += 1
+
+    def extend(self, xs):
+        if not isinstance(xs, (np.ndarray, list, tuple)):
+            xs = list(xs)
+        xs = np.asarray(xs, dtype=self.data.dtype)
+        self.reserve(len(xs))
+        self.data[self.n : self.n + len(xs)] = xs
+        self.n += len(xs)
+
+    def merge(self, other):
+        self.extend(other.values)
+
+    def select(self, ranks):
+        return np.partition(self.values, ranks)[ranks].tolist()
+
+    def arrays(self):
+        return {"value": self.values}
+
+    def __getstate__(self):
+        # Don't pickle the unused capacity.
+        return {"data": self.values, "n": self.n}
+
+
+class Table:
+
+    """
+    Record-like steps, e.g. DeadlineSteps, as aligned columns with one
+    row per step. Dates are kept as ordinals, with 0 for None;
+    categories as their index in the given labels; integers as int64,
+    with missing for None; and other values as floats, with NaN for
+    None.
+    """
+
+    missing = np.iinfo(np.int64).min
+
+    def __init__(self, keys, dates=(), categories=(), integers=()):
+        self.dates = dates
+        self.integers = integers
+        self.categories = {
+            key: {label: code for code, label in enumerate(categories[key])}
+            for key in categories
+        }
+        self.labels = {key: list(categories[key]) for key in categories}
+
+        def column(key):
+            if key in self.categories:
+                return Column(np.int8)
+            elif key in dates or key in integers:
+                return Column(np.int64)
+            else:
+                return Column(float)
+
+        self.columns = {key: column(key) for key in keys}
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def append(self, step):
+        for key, column in self.columns.items():
+            value = getattr(step, key)
+            if key in self.categories:
+                column.append(self.categories[key][value])
+            elif key in self.dates:
+                column.append(0 if value is None else value.toordinal())
+            elif key in self.integers:
+                column.append(self.missing if value is None else value)
+            else:
+                column.append(np.nan if value is None else value)
+
+    def extend(self, steps):
+        for step in steps:
+            self.append(step)
+
+    def extend_batch(self, batch):
+        for key, values in batch.table().items():
+            self.columns[key].extend(values)
+
+    def merge(self, other):
+        for key, column in self.columns.items():
+            column.merge(other.columns[key])
+
+    def column(self, key):
+        "The non-None values of one attribute, for summarizing."
+        values = self.columns[key].values
+        if key in self.categories:
+            counts = np.bincount(values, minlength=len(self.labels[key]))
+            labels = self.labels[key]
+            return Tally({labels[c]: n for c, n in enumerate(counts.tolist()) if n})
+        elif key in self.dates:
+            return Dates(Column.of(values[values != 0]))
+        elif key in self.integers:
+            return Column.of(values[values != self.missing])
+        else:
+            return Column.of(values[~np.isnan(values)])
+
+    def arrays(self):
+        return {key: column.values for key, column in self.columns.items()}
+
+
+def save(simulation, accumulator, directory):
+    """
+    Save the values in the Columns and Tables of accumulator, e.g. from
+    simulation.simulate(iters, store=Column), to .npy files in
+    directory, along with an index.json of which files hold which
+    node's values. Nodes are keyed by name so only named nodes are
+    saved; unrecorded nodes have nothing to save.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index = {}
+    for name, acc in named_accumulators(simulation, accumulator):
+        arrays = acc.arrays() if hasattr(acc, "arrays") else {}
+        if arrays:
+            if name in index:
+                raise ValueError(f"Duplicate node name {name}")
+            index[name] = {}
+            for field, values in arrays.items():
+                filename = f"{len(index) - 1}-{field}.npy"
+                np.save(os.path.join(directory, filename), values)
+                index[name][field] = filename
+    with open(os.path.join(directory, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+
+
+def load(directory):
+    """
+    Reopen values saved by save as a dict from node name to a dict of
+    memory-mapped arrays, so they can be sliced without reading them
+    all into memory. Plain nodes have one array, "value"; nodes with
+    record-like steps one per attribute, with dates as ordinals and
+    categories, such as deadline dispositions, as codes.
+    """
+    with open(os.path.join(directory, "index.json")) as f:
+        index = json.load(f)
+    return {
+        name: {
+            field: np.load(os.path.join(directory, filename), mmap_mode="r")
+            for field, filename in files.items()
+        }
+        for name, files in index.items()
+    }
+
+
+def named_accumulators(simulation, accumulator):
+    "Generate the name and own accumulator of each named node."
+    if isinstance(simulation, CompositeSimulation):
+        own = accumulator.own
+        for c, a in zip(simulation.children, accumulator.children):
+            yield from named_accumulators(c, a)
+    else:
+        own = accumulator
+    if hasattr(simulation, "name"):
+        yield simulation.name, own
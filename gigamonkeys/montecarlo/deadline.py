@@ -1,16 +1,30 @@
+from collections import Counter
 from dataclasses import dataclass
 from datetime import date
+from functools import partial
 from typing import Optional
 
+import numpy as np
+
 from gigamonkeys.montecarlo import CompositeSimulation
 from gigamonkeys.montecarlo import Named
 from gigamonkeys.montecarlo import NamedSummary
-from gigamonkeys.montecarlo import Simulation
+from gigamonkeys.montecarlo import default_quantiles
+from gigamonkeys.montecarlo import distribution
 from gigamonkeys.montecarlo.calendar import CalendarEstimate
+from gigamonkeys.montecarlo.calendar import CalendarSummarizer
+from gigamonkeys.montecarlo.calendar import dates
+from gigamonkeys.montecarlo.calendar import ordinals
+from gigamonkeys.montecarlo.calendar import total_days
+from gigamonkeys.montecarlo.columnar import Table
+
+# Dispositions are coded as their index in batches.
+dispositions = ("NOT_STARTED", "INCOMPLETE", "COMPLETE")
+NOT_STARTED, INCOMPLETE, COMPLETE = range(len(dispositions))
 
 
-def estimate(name, low, high):
-    return DeadlineEstimate(name=name, low=low, high=high)
+def estimate(name, low, high, **kwds):
+    return DeadlineEstimate(name=name, low=low, high=high, **kwds)
 
 
 def sequence(name, children):
@@ -21,18 +35,31 @@ def parallel(name, children):
     return DeadlineParallel(name=name, children=children)
 
 
-class DeadlineSummarizer(Simulation):
-    def summarize(self, accumulator):
-        def noNone(xs):
-            return [x for x in xs if x is not None]
+class DeadlineSummarizer(CalendarSummarizer):
 
-        summary = {
-            key: self.confidence_interval(
-                noNone((getattr(a, key) for a in accumulator))
-            )
-            for key in ("days", "calendar_days", "start", "end")
-        }
-        summary.update(self.categorical(a.disposition for a in accumulator))
+    categories = {"disposition": dispositions}
+
+    def column(self, accumulator, key):
+        "The non-None values of one attribute of the accumulated steps."
+        if isinstance(accumulator, list):
+            values = (getattr(a, key) for a in accumulator)
+            return [x for x in values if x is not None]
+        else:
+            return accumulator.column(key)
+
+    def summarize(self, accumulator):
+        summary = self.by_key(accumulator, self.confidence_interval)
+        return self.with_dispositions(accumulator, summary)
+
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        description = self.by_key(accumulator, partial(distribution, ps=ps, bins=bins))
+        return self.with_dispositions(accumulator, description)
+
+    def with_dispositions(self, accumulator, summary):
+        "The summary, named, with the proportion of each disposition added."
+        if summary is None:
+            return None
+        summary.update(self.categorical(self.column(accumulator, "disposition")))
         return NamedSummary(self.name, summary)
 
     def not_started(self, end):
@@ -66,21 +93,102 @@ class DeadlineStep:
             self.calendar_days = None
 
 
+@dataclass
+class DeadlineBatch:
+
+    """
+    A batch of DeadlineSteps as arrays, with dispositions as codes and
+    dates as ordinals. The start is meaningless, i.e. None, for steps
+    that were NOT_STARTED.
+    """
+
+    disposition: np.ndarray
+    days: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+
+    def columns(self):
+        started = self.disposition != NOT_STARTED
+        counts = np.bincount(self.disposition, minlength=len(dispositions))
+        return {
+            "days": self.days,
+            "calendar_days": (self.end - self.start)[started],
+            "start": self.start[started],
+            "end": self.end,
+            "disposition": Counter(
+                {dispositions[d]: n for d, n in enumerate(counts.tolist()) if n}
+            ),
+        }
+
+    def table(self):
+        "Aligned columns, one value per step, as kept by columnar.Table."
+        started = self.disposition != NOT_STARTED
+        return {
+            "days": self.days,
+            "calendar_days": np.where(started, self.end - self.start, Table.missing),
+            "start": np.where(started, self.start, 0),
+            "end": self.end,
+            "disposition": self.disposition,
+        }
+
+    def steps(self):
+        d = dates(self.start, self.end)
+        for disposition, days, start, end in zip(
+            self.disposition.tolist(),
+            self.days.tolist(),
+            self.start.tolist(),
+            self.end.tolist(),
+        ):
+            yield DeadlineStep(
+                dispositions[disposition],
+                days,
+                d[start] if disposition != NOT_STARTED else None,
+                d[end],
+            )
+
+
+def stopped(batches):
+    """
+    Whether any of the batches didn't complete and the end of the first
+    one that didn't, iteration by iteration.
+    """
+    incomplete = np.array([b.disposition != COMPLETE for b in batches])
+    ends = np.array([b.end for b in batches])
+    first = ends[incomplete.argmax(axis=0), np.arange(ends.shape[1])]
+    return incomplete.any(axis=0), first
+
+
 class DeadlineEstimate(DeadlineSummarizer, CalendarEstimate):
 
     "An estimated value which observes a due date."
 
     def make_step(self, start=None, due_date=None, calendar=None, **kwds):
+        # Always draw, like step_batch, so both engines use the same values.
+        c = super().make_step(start=start, due_date=due_date, calendar=calendar, **kwds)
         if start >= due_date:
             return self.not_started(start)
+        elif c.end > due_date:
+            return self.incomplete(c.days, start, due_date)
         else:
-            c = super().make_step(
-                start=start, due_date=due_date, calendar=calendar, **kwds
-            )
-            if c.end > due_date:
-                return self.incomplete(c.days, start, due_date)
-            else:
-                return self.complete(c.days, c.start, c.end)
+            return self.complete(c.days, c.start, c.end)
+
+    def step_batch(
+        self, accumulator, size, start=None, due_date=None, calendar=None, **kwds
+    ):
+        days = self.sample(size)
+        start = ordinals(start, size)
+        due_date = ordinals(due_date, size)
+        end = calendar.n_workdays_after_batch(start, days)
+        not_started = start >= due_date
+        incomplete = ~not_started & (end > due_date)
+        b = DeadlineBatch(
+            np.select([not_started, incomplete], [NOT_STARTED, INCOMPLETE], COMPLETE),
+            np.where(not_started, 0.0, days),
+            start,
+            np.select([not_started, incomplete], [start, due_date], end),
+        )
+        self.accumulate_batch(accumulator, b)
+        return b
 
 
 class DeadlineComposite(Named, CompositeSimulation, DeadlineSummarizer):
@@ -91,29 +199,27 @@ class DeadlineSequence(DeadlineComposite):
 
     "Like CalendarSequence but also deadline aware."
 
-    def step_children(
-        self, accumulators, start=None, due_date=None, calendar=None, **kwds
-    ):
-        next_start = start
-
-        def step(c, a):
-            nonlocal next_start
-            v = c.step(
-                a, start=next_start, due_date=due_date, calendar=calendar, **kwds
-            )
-            # once we get a child that doesn't finish we will run
-            # through the rest of the children with a start date
-            # guaranteed to generate a not_started result.
-            next_start = v.end if v.disposition == "COMPLETE" else due_date
-            return v
+    def next_kwds(self, kwds, value):
+        # once we get a child that doesn't finish we will run through
+        # the rest of the children with a start date guaranteed to
+        # generate a not_started result.
+        if value.disposition == "COMPLETE":
+            return {**kwds, "start": value.end}
+        else:
+            return {**kwds, "start": kwds["due_date"]}
 
-        return [step(c, a) for c, a in zip(self.children, accumulators)]
+    def next_kwds_batch(self, kwds, batch):
+        due_date = ordinals(kwds["due_date"], len(batch.end))
+        return {
+            **kwds,
+            "start": np.where(batch.disposition == COMPLETE, batch.end, due_date),
+        }
 
     def combine_child_values(self, child_values):
         if child_values[0].disposition == "NOT_STARTED":
             return self.not_started(child_values[0].end)
         else:
-            days = sum(c.days for c in child_values)
+            days = total_days(child_values)
             start = child_values[0].start
             if all(c.disposition == "COMPLETE" for c in child_values):
                 return self.complete(days, start, child_values[-1].end)
@@ -123,29 +229,34 @@ class DeadlineSequence(DeadlineComposite):
                 )
                 return self.incomplete(days, start, incomplete.end)
 
+    def combine_child_batches(self, child_batches):
+        first = child_batches[0]
+        not_started = first.disposition == NOT_STARTED
+        any_incomplete, incomplete_end = stopped(child_batches)
+        days = total_days(child_batches)
+        return DeadlineBatch(
+            np.select(
+                [not_started, any_incomplete], [NOT_STARTED, INCOMPLETE], COMPLETE
+            ),
+            np.where(not_started, 0.0, days),
+            first.start,
+            np.select(
+                [not_started, any_incomplete],
+                [first.end, incomplete_end],
+                child_batches[-1].end,
+            ),
+        )
+
 
 class DeadlineParallel(DeadlineComposite):
 
     "Like CalendarParallel but also deadline aware."
 
-    def step_children(
-        self, accumulators, start=None, due_date=None, calendar=None, **kwds
-    ):
-
-        # Step the children once with our due date to see what happens
-        # but don't really accumulate the results. FIXME: should
-        # eventually make accumulator a class so we can have a null
-        # object version.
-        fake_acc = [c.accumulator() for c in self.children]
-        first_pass = super().step_children(
-            fake_acc, start=start, due_date=due_date, calendar=calendar, **kwds
-        )
-
-        incomplete = next((c for c in first_pass if c.disposition != "COMPLETE"), None)
-        real_due_date = incomplete.end if incomplete else due_date
-        return super().step_children(
-            accumulators, start=start, due_date=real_due_date, calendar=calendar, **kwds
-        )
+    # The children can all be stepped with our due date in one pass.
+    # Any child that doesn't complete ends on the due date since an
+    # incomplete estimate stops there and composites end where their
+    # incomplete children do. And when we start on or after the due
+    # date none of the children start, whatever due date they get.
 
     def combine_child_values(self, child_values):
         if all(c.disposition == "NOT_STARTED" for c in child_values):
@@ -159,7 +270,19 @@ class DeadlineParallel(DeadlineComposite):
             else:
                 return self.incomplete(days, start, end)
 
-        days = max(c.days for c in child_values)
-        start = child_values[0].start
-        end = max(c.end for c in child_values)
-        return DeadlineStep(days, start, end)
+    def combine_child_batches(self, child_batches):
+        first = child_batches[0]
+        not_started = np.logical_and.reduce(
+            [c.disposition == NOT_STARTED for c in child_batches]
+        )
+        complete = np.logical_and.reduce(
+            [c.disposition == COMPLETE for c in child_batches]
+        )
+        days = np.maximum.reduce([c.days for c in child_batches])
+        end = np.maximum.reduce([c.end for c in child_batches])
+        return DeadlineBatch(
+            np.select([not_started, complete], [NOT_STARTED, COMPLETE], INCOMPLETE),
+            np.where(not_started, 0.0, days),
+            first.start,
+            np.where(not_started, first.end, end),
+        )
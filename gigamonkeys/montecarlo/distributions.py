@@ -0,0 +1,163 @@
+# Shapes of the distribution of an Estimate's values. Each is fitted,
+# like the original normal estimates, so that 90% of its values fall
+# between the estimate's low and high, and turns a whole array of
+# draws from a random stream into values at once. The skewed shapes
+# are standard shapes on [0, 1] stretched to fit; anything they need to
+# compute to fit, or to invert their CDF, is computed once per shape
+# and shared by all the estimates with that shape.
+
+from functools import lru_cache
+from math import log
+
+import numpy as np
+
+# From https://en.wikipedia.org/wiki/Normal_distribution#Quantile_function
+z_90 = 1.644853626951
+
+# Points in inverse CDF lookup tables.
+table_size = 4097
+
+
+class Normal:
+
+    "Normal with 90% of the values between low and high."
+
+    def __init__(self, low, high, mode=None):
+        # 90% of normal values will fall within +/- ~1.64 standard
+        # deviations of the mean. We want 90% of values to fall
+        # between low and high, so we want to back out the desired
+        # standard deviation such that 1.64 standard deviations is the
+        # distance from mid to high (or to low).
+        half_width = (high - low) / 2
+        self.mid = low + half_width
+        self.stddev = half_width / z_90
+
+    def draw(self, stream, size):
+        return self.mid + self.stddev * stream.normals(size)
+
+
+class Lognormal:
+
+    """
+    Skewed right, with 90% of the values between low and high and the
+    logs of the values normal. Needs a positive low.
+    """
+
+    def __init__(self, low, high, mode=None):
+        if low <= 0:
+            raise ValueError("Lognormal estimates need a positive low")
+        self.normal = Normal(log(low), log(high))
+
+    def draw(self, stream, size):
+        return np.exp(self.normal.draw(stream, size))
+
+
+class Stretched:
+
+    """
+    A shape on [0, 1] with its peak somewhere in between, stretched so
+    its 5th and 95th percentiles are low and high and its mode is mode,
+    by default halfway between. Subclasses define inverse(peak, u), the
+    inverse CDF of the shape with the given peak.
+    """
+
+    def __init__(self, low, high, mode=None):
+        if mode is None:
+            mode = (low + high) / 2
+        self.peak = fit(type(self), (mode - low) / (high - low))
+        q05, q95 = self.inverse(self.peak, np.array([0.05, 0.95]))
+        self.scale = (high - low) / (q95 - q05)
+        self.offset = low - q05 * self.scale
+
+    def draw(self, stream, size):
+        values = self.inverse(self.peak, stream.uniforms(size))
+        values *= self.scale
+        values += self.offset
+        return values
+
+
+class Triangular(Stretched):
+
+    "Triangular, rising linearly to the mode and falling linearly after."
+
+    @staticmethod
+    def inverse(peak, u):
+        return np.where(u < peak, np.sqrt(u * peak), 1 - np.sqrt((1 - u) * (1 - peak)))
+
+
+class Pert(Stretched):
+
+    """
+    The beta distribution of PERT three-point estimates, with shape
+    parameters 1 + 4 * peak and 1 + 4 * (1 - peak). Its inverse CDF has
+    no closed form so it's looked up in a table.
+    """
+
+    @staticmethod
+    def inverse(peak, u):
+        table, slopes = pert_table(peak)
+        # The table is evenly spaced in u so we can index rather than
+        # search it, and interpolate in place.
+        x = u * (table_size - 1)
+        i = x.astype(np.intp)
+        np.minimum(i, table_size - 2, out=i)
+        x -= i
+        x *= slopes[i]
+        x += table[i]
+        return x
+
+
+shapes = {
+    "normal": Normal,
+    "lognormal": Lognormal,
+    "triangular": Triangular,
+    "pert": Pert,
+}
+
+
+def shape(distribution, low, high, mode=None):
+    "The shape for the named distribution."
+    try:
+        kind = shapes[distribution]
+    except KeyError:
+        raise ValueError(f"Unknown distribution {distribution}")
+    return kind(low, high, mode)
+
+
+@lru_cache(maxsize=None)
+def fit(kind, position):
+    """
+    The peak at which the mode of kind stretched to put its 5th and
+    95th percentiles at 0 and 1 is at position.
+    """
+
+    def stretched_mode(peak):
+        q05, q95 = kind.inverse(peak, np.array([0.05, 0.95]))
+        return (peak - q05) / (q95 - q05)
+
+    lo, hi = 0.0, 1.0
+    if not stretched_mode(lo) <= position <= stretched_mode(hi):
+        raise ValueError("Mode too far outside of the estimate")
+    # The stretched mode rises with the peak.
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if stretched_mode(mid) < position:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+@lru_cache(maxsize=None)
+def pert_table(peak):
+    """
+    The inverse CDF of the PERT shape at table_size evenly spaced
+    points and the slope from each point to the next.
+    """
+    a, b = 1 + 4 * peak, 1 + 4 * (1 - peak)
+    x = np.linspace(0, 1, 16 * table_size)
+    pdf = x ** (a - 1) * (1 - x) ** (b - 1)
+    cdf = np.concatenate([[0], np.cumsum((pdf[1:] + pdf[:-1]) / 2)])
+    cdf /= cdf[-1]
+    table = np.interp(np.linspace(0, 1, table_size), cdf, x)
+    return table, np.diff(table)
@@ -0,0 +1,167 @@
+# Opt-in profiling of where the time of a run goes, node by node. Pass
+# a Profile as the profile argument of Simulation.run or simulate and
+# afterwards it holds, for each node, the time spent stepping it, how
+# many times it was stepped, how many random values it drew, and how
+# much memory its accumulator takes, plus the overall samples per
+# second. Runs without a profile don't pay for any of it.
+
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Tuple
+
+from gigamonkeys.montecarlo import CompositeSimulation
+from gigamonkeys.montecarlo.memo import nbytes
+
+
+@dataclass
+class NodeStats:
+
+    """
+    What one node of a profiled run cost. The seconds and calls are
+    for the node's own work, e.g. combining its children's values; a
+    node whose step the plan can't see into, such as a DAG, is timed
+    as a whole. Calls count the node's steps or combines, not the
+    working out of its children's args, whose time is in seconds.
+    Draws are of the node's own random stream and bytes are of its own
+    accumulator.
+    """
+
+    path: Tuple[int, ...]
+    frames: Tuple[str, ...]
+    seconds: float = 0.0
+    calls: int = 0
+    draws: int = 0
+    bytes: int = 0
+
+    @property
+    def label(self):
+        return "/".join(self.frames)
+
+
+class Profile:
+
+    "Per-node costs of the runs it's passed to, added up."
+
+    def __init__(self):
+        self.nodes = {}
+        self.iterations = 0
+        self.seconds = 0.0
+        self.summarize_seconds = 0.0
+
+    def start(self, simulation):
+        "Get ready to profile a run of simulation."
+        for node, path, frames in walk(simulation):
+            if path not in self.nodes:
+                self.nodes[path] = NodeStats(path, frames)
+
+    def record(self, instruction, seconds):
+        "Record an instruction of a plan.Plan having taken seconds."
+        stats = self.nodes[instruction.path]
+        stats.seconds += seconds
+        stats.calls += counts(instruction)
+
+    def timed(self, op, instruction):
+        "Wrap op, performing instruction on one iteration, to record its time."
+        stats = self.nodes[instruction.path]
+        calls = counts(instruction)
+
+        def timed_op(slots):
+            start = perf_counter()
+            op(slots)
+            stats.seconds += perf_counter() - start
+            stats.calls += calls
+
+        return timed_op
+
+    def count_draws(self, simulation):
+        "Add up the values drawn by each node's stream in the last batch."
+        for node, path, _ in walk(simulation):
+            if hasattr(node, "stream"):
+                self.nodes[path].draws += node.stream.draws
+
+    def finish(self, simulation, accumulator, iterations, seconds):
+        "Record the size of each accumulator and the time of the whole run."
+        for path, acc in accumulators(simulation, accumulator):
+            self.nodes[path].bytes = nbytes(acc)
+        self.iterations += iterations
+        self.seconds += seconds
+
+    @property
+    def samples_per_sec(self):
+        return self.iterations / self.seconds if self.seconds else 0.0
+
+    def table(self):
+        """
+        A row per node, as a dict, slowest first. Total seconds and
+        draws include the node's descendants; bytes are its own.
+        """
+        totals = {path: [0.0, 0] for path in self.nodes}
+        for path, stats in self.nodes.items():
+            for n in range(len(path) + 1):
+                totals[path[:n]][0] += stats.seconds
+                totals[path[:n]][1] += stats.draws
+        rows = [
+            {
+                "node": stats.label,
+                "calls": stats.calls,
+                "seconds": stats.seconds,
+                "total_seconds": totals[path][0],
+                "draws": totals[path][1],
+                "bytes": stats.bytes,
+            }
+            for path, stats in self.nodes.items()
+        ]
+        return sorted(rows, key=lambda r: r["total_seconds"], reverse=True)
+
+    def folded(self):
+        """
+        Lines of "root;child;grandchild microseconds" giving each node's
+        own time, the collapsed stack format flamegraph.pl and
+        speedscope read.
+        """
+        lines = []
+        for stats in self.nodes.values():
+            if stats.seconds:
+                stack = ";".join(f.replace(";", ":") for f in stats.frames)
+                lines.append(f"{stack} {round(stats.seconds * 1e6)}")
+        return lines
+
+    def report(self):
+        "The table as text, with the totals of the run."
+        lines = [
+            f"{self.iterations} iterations in {self.seconds:.3f}s,"
+            f" {self.samples_per_sec:.0f} samples/s;"
+            f" summarizing took {self.summarize_seconds:.3f}s",
+            f"{'total s':>9} {'own s':>9} {'calls':>8} {'draws':>10} {'bytes':>11}"
+            "  node",
+        ]
+        for r in self.table():
+            lines.append(
+                f"{r['total_seconds']:>9.4f} {r['seconds']:>9.4f} {r['calls']:>8}"
+                f" {r['draws']:>10} {r['bytes']:>11}  {r['node']}"
+            )
+        return "\n".join(lines)
+
+
+def counts(instruction):
+    "How many calls of its node an instruction counts as."
+    return 0 if instruction.op == "kwds" else 1
+
+
+def walk(simulation, path=(), frames=()):
+    "Generate each node with its path and the labels of it and its ancestors."
+    frames += (getattr(simulation, "name", None) or type(simulation).__name__,)
+    yield simulation, path, frames
+    if isinstance(simulation, CompositeSimulation):
+        for i, c in enumerate(simulation.children):
+            yield from walk(c, path + (i,), frames)
+
+
+def accumulators(simulation, accumulator, path=()):
+    "Generate the path and own accumulator of each node."
+    if isinstance(simulation, CompositeSimulation):
+        yield path, accumulator.own
+        for i, (c, a) in enumerate(zip(simulation.children, accumulator.children)):
+            yield from accumulators(c, a, path + (i,))
+    else:
+        yield path, accumulator
@@ -0,0 +1,219 @@
+# Memoizing the batches of values of subtrees so that after an edit to
+# one part of a tree, re-running it only re-simulates the changed nodes
+# and their ancestors. Pass a Memo as the memo argument to
+# Simulation.simulate and keep it around between runs.
+
+import sys
+import warnings
+from collections import OrderedDict
+from functools import partial
+from hashlib import blake2b
+from types import BuiltinFunctionType
+from types import FunctionType
+from types import MethodType
+from types import ModuleType
+
+import numpy as np
+
+from gigamonkeys.montecarlo import Simulation
+
+# Attributes of simulations that are random state rather than part of
+# what they simulate.
+state = ("children", "seed", "stream", "values")
+
+
+class Uncacheable(ValueError):
+    "Raised for values canonical can't represent by their content."
+
+
+class Memo:
+
+    """
+    LRU cache of the values of subtrees, batch by batch, holding up to
+    about max_bytes of values.
+
+    A subtree's values are reused when its content, i.e. the class and
+    attributes of each node, the seeds and sampling of its random
+    streams, the keyword args it's stepped with, and the kind of
+    accumulators it's simulated into all match. So only runs with the
+    same, explicit, seed can share values, and a changed leaf misses
+    along with its ancestors and, in calendar sequences, the siblings
+    whose start dates move.
+
+    Subtrees whose leaves don't draw from Estimate streams are never
+    cached since we can't tell what their values depend on.
+
+    Room is made by evicting entries the current run hasn't used. If
+    one run's values need more than max_bytes the rest aren't added,
+    with a warning, so the next run still finds the first batches'.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.run = 0
+        self.full = False
+
+    def begin(self):
+        "Start a run, whose entries won't be evicted to make room during it."
+        self.run += 1
+        self.full = False
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry[:3] + (self.run,)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[:2]
+
+    def put(self, key, value, accumulator, size):
+        if key in self.entries:
+            return
+        # Entries are in order of last use so any the run hasn't used
+        # come first.
+        while self.bytes + size > self.max_bytes:
+            oldest = next(iter(self.entries.values()), None)
+            if oldest is None or oldest[3] == self.run:
+                self.overflow()
+                return
+            _, (_, _, evicted, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+        self.entries[key] = (value, accumulator, size, self.run)
+        self.bytes += size
+
+    def overflow(self):
+        if not self.full:
+            self.full = True
+            warnings.warn(
+                f"One run's values need more than the memo's {self.max_bytes}"
+                " bytes so only some of them are kept; give it a bigger max_bytes"
+            )
+
+    def scope(self, *args):
+        """
+        A view of this memo for batches simulated with args, e.g. the
+        store. Raises Uncacheable if we can't tell what args are.
+        """
+        return Scope(self, digest(canonical(args)))
+
+
+class Scope:
+
+    "Memo keys for one kind of batch."
+
+    def __init__(self, memo, prefix):
+        self.memo = memo
+        self.prefix = prefix
+
+    def key(self, fingerprint, node, kwds):
+        streams = tuple(
+            (
+                type(leaf.stream).__name__,
+                leaf.stream.dimension,
+                leaf.seed.entropy,
+                leaf.seed.spawn_key,
+            )
+            for leaf in leaves(node)
+        )
+        return (self.prefix, fingerprint, digest(canonical(kwds)), streams)
+
+    def get(self, key):
+        return self.memo.get(key)
+
+    def put(self, key, value, accumulator, size):
+        self.memo.put(key, value, accumulator, size)
+
+
+def cacheable(node):
+    "Whether all node's randomness comes from Estimate streams we can key on."
+    if hasattr(node, "children"):
+        return all(cacheable(c) for c in node.children)
+    else:
+        return hasattr(node, "stream") and hasattr(node.stream, "dimension")
+
+
+def leaves(node):
+    if hasattr(node, "children"):
+        for c in node.children:
+            yield from leaves(c)
+    else:
+        yield node
+
+
+def fingerprint(node):
+    "A digest of what node, and all its descendants, simulate."
+    children = tuple(fingerprint(c) for c in getattr(node, "children", ()))
+    return digest((canonical(node), children))
+
+
+def canonical(x):
+    """
+    A representation of x built of tuples, strings and numbers, equal
+    for equal values, to hash. Simulations are represented by their
+    class and attributes other than their children and random state.
+    Functions are represented by name, so lambdas and nested functions,
+    which a name doesn't identify, raise Uncacheable, as do objects
+    represented only by their identity.
+    """
+    if isinstance(x, Simulation):
+        attributes = {k: v for k, v in vars(x).items() if k not in state}
+        return (type(x).__module__, type(x).__qualname__, canonical(attributes))
+    elif isinstance(x, dict):
+        return tuple(sorted((repr(k), canonical(v)) for k, v in x.items()))
+    elif isinstance(x, (list, tuple)):
+        return tuple(canonical(v) for v in x)
+    elif isinstance(x, (set, frozenset)):
+        return tuple(sorted(canonical(v) for v in x))
+    elif isinstance(x, type):
+        return named(x)
+    elif isinstance(x, np.ndarray):
+        return (x.dtype.str, x.shape, blake2b(np.ascontiguousarray(x)).hexdigest())
+    elif isinstance(x, (str, int, float, bool, type(None))):
+        return repr(x)
+    elif hasattr(x, "isoformat"):
+        return x.isoformat()
+    elif isinstance(x, partial):
+        return ("partial", canonical(x.func), canonical(x.args), canonical(x.keywords))
+    elif isinstance(x, (MethodType, BuiltinFunctionType)) and not isinstance(
+        x.__self__, (ModuleType, type(None))
+    ):
+        return ("method", canonical(x.__self__), x.__name__)
+    elif isinstance(x, (FunctionType, BuiltinFunctionType)):
+        return named(x)
+    elif hasattr(x, "__dict__"):
+        return (type(x).__module__, type(x).__qualname__, canonical(vars(x)))
+    elif " at 0x" in repr(x):
+        raise Uncacheable(f"Can't identify {type(x).__qualname__} by content")
+    else:
+        return repr(x)
+
+
+def named(x):
+    "A function or class by its name, if that identifies it."
+    if "<" in x.__qualname__:
+        raise Uncacheable(f"Can't identify {x.__qualname__} by name")
+    return f"{x.__module__}.{x.__qualname__}"
+
+
+def digest(x):
+    return blake2b(repr(x).encode(), digest_size=16).hexdigest()
+
+
+def nbytes(x):
+    "Roughly how much memory x takes, counting arrays and the values in containers."
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    elif isinstance(x, (list, tuple)):
+        return sys.getsizeof(x) + (len(x) * nbytes(x[0]) if x else 0)
+    elif isinstance(x, dict):
+        return sys.getsizeof(x) + sum(nbytes(v) for v in x.values())
+    elif hasattr(x, "__dict__"):
+        return sys.getsizeof(x) + nbytes(vars(x))
+    else:
+        return sys.getsizeof(x)
@@ -0,0 +1,288 @@
+# Simulation trees lowered to a flat list of instructions, in the order
+# they need to run, over a list of slots holding each node's value and
+# the keyword args each node is stepped with. Evaluating a plan does the
+# same work as stepping the tree, node for node and draw for draw, but
+# without recursing through it, so it gives exactly the same results.
+
+from collections import defaultdict
+from dataclasses import dataclass
+from time import perf_counter
+from typing import List
+from typing import Tuple
+
+from gigamonkeys.montecarlo import CompositeSimulation
+from gigamonkeys.montecarlo import Estimate
+from gigamonkeys.montecarlo import Null
+from gigamonkeys.montecarlo import Simulation
+from gigamonkeys.montecarlo.memo import Uncacheable
+from gigamonkeys.montecarlo.memo import cacheable
+from gigamonkeys.montecarlo.memo import fingerprint
+from gigamonkeys.montecarlo.memo import nbytes
+
+
+@dataclass
+class Instruction:
+
+    """
+    One instruction of a plan, putting its result in slot out.
+
+    - "step" steps node with the keyword args in slot inputs[0]. The
+      node is a leaf or a composite the plan can't see into.
+
+    - "kwds" computes the keyword args for the next child of node from
+      the args in slot inputs[0] and the last child's value in inputs[1].
+
+    - "combine" combines the values of node's children in inputs.
+
+    The path is the indices of the children leading from the root to
+    node, to find its accumulator.
+    """
+
+    op: str
+    node: Simulation
+    path: Tuple[int, ...]
+    out: int
+    inputs: List[int]
+
+
+@dataclass
+class Span:
+
+    """
+    The instructions, from start up to end, that step a node stepped
+    with the keyword args in slot kwds, leaving its value in slot out.
+    """
+
+    node: Simulation
+    path: Tuple[int, ...]
+    kwds: int
+    start: int
+    end: int
+    out: int
+
+
+class Plan:
+
+    """
+    A simulation compiled to a flat list of instructions. Stepping a
+    plan takes the same arguments as stepping the simulation and
+    accumulates into an accumulator from the simulation.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.instructions = []
+        # Spans starting at each instruction, outermost first.
+        self.spans = defaultdict(list)
+        # Slot 0 holds the keyword args of the run.
+        self.slots = 1
+        self.result = self.lower(simulation, (), 0)
+        self.fingerprints = None
+
+    def slot(self):
+        self.slots += 1
+        return self.slots - 1
+
+    def emit(self, op, node, path, inputs):
+        out = self.slot()
+        self.instructions.append(Instruction(op, node, path, out, inputs))
+        return out
+
+    def lower(self, node, path, kwds):
+        "Emit instructions for node stepped with the args in slot kwds."
+        start = len(self.instructions)
+        if not transparent(node):
+            out = self.emit("step", node, path, [kwds])
+        else:
+            values = []
+            child_kwds = kwds
+            for i, c in enumerate(node.children):
+                if values and overrides(node, "next_kwds"):
+                    child_kwds = self.emit("kwds", node, path, [child_kwds, values[-1]])
+                values.append(self.lower(c, path + (i,), child_kwds))
+            out = self.emit("combine", node, path, values)
+        span = Span(node, path, kwds, start, len(self.instructions), out)
+        self.spans[start].insert(0, span)
+        return out
+
+    def step_each(self, accumulator, size, profile=None, **kwds):
+        """
+        Step size times, one iteration at a time, like step, timing
+        each instruction if profile, an instrument.Profile, is given.
+        """
+        ops = [bind(i, find(accumulator, i.path)) for i in self.instructions]
+        if profile is not None:
+            ops = [profile.timed(op, i) for op, i in zip(ops, self.instructions)]
+        slots = [None] * self.slots
+        slots[0] = kwds
+        for _ in range(size):
+            for op in ops:
+                op(slots)
+        return slots[self.result]
+
+    def step_batch(self, accumulator, size, memo=None, profile=None, **kwds):
+        """
+        Step a whole batch at once, like step_batch. If memo, a
+        memo.Scope, is given, nodes whose values it has are skipped and
+        given its values instead, and the rest are added to it. If
+        profile, an instrument.Profile, is given, each instruction is
+        timed.
+        """
+        slots = [None] * self.slots
+        slots[0] = kwds
+        # Spans being simulated, to add to memo when they end.
+        pending = []
+        n = 0
+        while n < len(self.instructions):
+            if memo is not None:
+                n = self.recall(n, memo, accumulator, slots, pending)
+                if n == len(self.instructions):
+                    break
+
+            i = self.instructions[n]
+            if profile is None:
+                self.execute(i, accumulator, size, slots)
+            else:
+                start = perf_counter()
+                self.execute(i, accumulator, size, slots)
+                profile.record(i, perf_counter() - start)
+            n += 1
+
+            while pending and pending[-1][0].end == n:
+                span, key = pending.pop()
+                acc = find(accumulator, span.path)
+                # Descendants' values are counted in their own entries.
+                own = getattr(acc, "own", acc)
+                value = slots[span.out]
+                memo.put(key, value, acc, nbytes(value) + nbytes(own))
+
+        return slots[self.result]
+
+    def execute(self, i, accumulator, size, slots):
+        "Perform instruction i on a batch."
+        node = i.node
+        acc = find(accumulator, i.path)
+        if i.op == "step":
+            b = node.step_batch(acc, size, **slots[i.inputs[0]])
+        elif i.op == "kwds":
+            b = node.next_kwds_batch(slots[i.inputs[0]], slots[i.inputs[1]])
+        else:
+            b = node.combine_child_batches([slots[c] for c in i.inputs])
+            node.accumulate_batch(acc.own, b)
+        slots[i.out] = b
+
+    def recall(self, n, memo, accumulator, slots, pending):
+        """
+        Look up the nodes starting at instruction n in memo, outermost
+        first, filling in the values of the first one found and
+        returning the instruction after it. Nodes not found are pushed
+        onto pending.
+        """
+        if self.fingerprints is None:
+            self.fingerprints = {
+                id(s.node): fingerprint_of(s.node)
+                for spans in self.spans.values()
+                for s in spans
+                if cacheable(s.node)
+            }
+        for span in self.spans.get(n, ()):
+            fp = self.fingerprints.get(id(span.node))
+            if fp is None:
+                continue
+            try:
+                key = memo.key(fp, span.node, slots[span.kwds])
+            except Uncacheable:
+                continue
+            found = memo.get(key)
+            if found is not None:
+                value, cached = found
+                span.node.merge(find(accumulator, span.path), cached)
+                slots[span.out] = value
+                return self.recall(span.end, memo, accumulator, slots, pending)
+            pending.append((span, key))
+        return n
+
+
+def compile(simulation):
+    "Lower simulation to a Plan."
+    return Plan(simulation)
+
+
+def fingerprint_of(node):
+    "The fingerprint of node or None if it has parts we can't identify."
+    try:
+        return fingerprint(node)
+    except Uncacheable:
+        return None
+
+
+def bind(instruction, acc):
+    "A function performing instruction on the slots of one iteration."
+    node, out, inputs = instruction.node, instruction.out, instruction.inputs
+
+    if instruction.op == "step":
+        if plain(node) and isinstance(acc, Null):
+            values = node.values
+
+            def op(slots):
+                slots[out] = next(values)
+
+        elif plain(node):
+            values, append = node.values, acc.append
+
+            def op(slots):
+                slots[out] = v = next(values)
+                append(v)
+
+        else:
+            step, kwds = node.step, inputs[0]
+
+            def op(slots):
+                slots[out] = step(acc, **slots[kwds])
+
+    elif instruction.op == "kwds":
+        next_kwds, kwds, last = node.next_kwds, inputs[0], inputs[1]
+
+        def op(slots):
+            slots[out] = next_kwds(slots[kwds], slots[last])
+
+    elif isinstance(acc.own, Null):
+        combine = node.combine_child_values
+
+        def op(slots):
+            slots[out] = combine([slots[c] for c in inputs])
+
+    else:
+        combine, append = node.combine_child_values, acc.own.append
+
+        def op(slots):
+            slots[out] = v = combine([slots[c] for c in inputs])
+            append(v)
+
+    return op
+
+
+def find(accumulator, path):
+    "The accumulator at the end of path."
+    for i in path:
+        accumulator = accumulator.children[i]
+    return accumulator
+
+
+def overrides(node, method):
+    "Whether node's class overrides method of CompositeSimulation."
+    return getattr(type(node), method) is not getattr(CompositeSimulation, method)
+
+
+def transparent(node):
+    "Whether node steps its children in the usual way, so a plan can see into it."
+    return isinstance(node, CompositeSimulation) and not any(
+        overrides(node, m)
+        for m in ("step", "step_children", "step_batch", "step_children_batch")
+    )
+
+
+def plain(node):
+    "Whether node is stepped with nothing more than the next value Estimate draws."
+    cls = type(node)
+    return cls.step is Simulation.step and cls.make_step is Estimate.make_step
@@ -0,0 +1,206 @@
+# Strategies for drawing the random values behind each Estimate. Plain
+# pseudo-random draws converge at the usual 1/sqrt(n) rate; stratified
+# and quasi-random draws cover the distribution more evenly and so get
+# stable interval bounds with fewer iterations.
+
+from itertools import count
+
+import numpy as np
+
+
+class Sampler:
+
+    """
+    Hands out a stream of draws to each leaf of one batch. The method
+    is "random" for plain pseudo-random draws, "lhs" for Latin
+    hypercube stratification of each leaf, or "halton" for scrambled
+    Halton sequences with each leaf using its own dimension.
+    """
+
+    def __init__(self, method, size):
+        self.method = method
+        self.size = size
+        self.dimensions = count()
+
+    def stream(self, rng, method=None):
+        "A stream for the next leaf, using its own method if it has one."
+        dimension = next(self.dimensions)
+        try:
+            kind = methods[method or self.method]
+        except KeyError:
+            raise ValueError(f"Unknown sampling method {method or self.method}")
+        return kind(rng, dimension)
+
+
+class Stream:
+
+    "Pseudo-random draws."
+
+    def __init__(self, rng, dimension):
+        self.rng = rng
+        self.dimension = dimension
+        # Values drawn, for instrument.Profile.
+        self.draws = 0
+
+    def normals(self, size):
+        return self.rng.standard_normal(size)
+
+    def uniforms(self, size):
+        return self.rng.random(size)
+
+
+class QuasiStream(Stream):
+
+    "Draws normals by transforming evenly spread uniforms."
+
+    def normals(self, size):
+        return ndtri(self.uniforms(size))
+
+
+class LatinHypercube(QuasiStream):
+
+    """
+    Each call of size n puts exactly one draw in each of the n equal
+    slices of [0, 1), in random order. Since every leaf is stratified
+    independently this is Latin hypercube sampling of the whole tree.
+    """
+
+    def uniforms(self, size):
+        return (self.rng.permutation(size) + self.rng.random(size)) / size
+
+
+class Halton(QuasiStream):
+
+    """
+    The van der Corput sequence in the base of the dimension-th prime,
+    with each digit randomly permuted and a random jitter within the
+    finest cell. Each call is a freshly scrambled run of the sequence,
+    so different batches are independent replicates.
+    """
+
+    def __init__(self, rng, dimension):
+        super().__init__(rng, dimension)
+        self.base = prime(dimension)
+
+    def uniforms(self, size):
+        base = self.base
+        digits = 1
+        while base ** digits < size:
+            digits += 1
+        indices = np.arange(size)
+        u = np.zeros(size)
+        scale = 1.0
+        for _ in range(digits):
+            scale /= base
+            permutation = self.rng.permutation(base)
+            indices, digit = np.divmod(indices, base)
+            u += permutation[digit] * scale
+        return u + self.rng.random(size) * scale
+
+
+methods = {"random": Stream, "lhs": LatinHypercube, "halton": Halton}
+
+
+_primes = [2]
+
+
+def prime(n):
+    "The n-th prime, counting from 0."
+    while len(_primes) <= n:
+        candidate = _primes[-1] + 1
+        while any(candidate % p == 0 for p in _primes if p * p <= candidate):
+            candidate += 1
+        _primes.append(candidate)
+    return _primes[n]
+
+
+def ndtri(p):
+    """
+    Inverse of the standard normal CDF, vectorized. From Wichura,
+    "Algorithm AS241: The Percentage Points of the Normal Distribution"
+    (1988), as used by statistics.NormalDist.inv_cdf.
+    """
+    p = np.asarray(p, dtype=float)
+    q = p - 0.5
+    x = np.empty_like(p)
+
+    central = np.abs(q) <= 0.425
+    qc = q[central]
+    r = 0.180625 - qc * qc
+    x[central] = qc * np.polyval(_a, r) / np.polyval(_b, r)
+
+    tail = ~central
+    qt = q[tail]
+    r = np.sqrt(-np.log(np.where(qt <= 0, p[tail], 1 - p[tail])))
+    near = r <= 5
+    xt = np.where(
+        near,
+        np.polyval(_c, r - 1.6) / np.polyval(_d, r - 1.6),
+        np.polyval(_e, r - 5) / np.polyval(_f, r - 5),
+    )
+    x[tail] = np.where(qt < 0, -xt, xt)
+    return x
+
+
+# Coefficients for ndtri, highest power first.
+
+_a = [
+    2.5090809287301226727e3,
+    3.3430575583588128105e4,
+    6.7265770927008700853e4,
+    4.5921953931549871457e4,
+    1.3731693765509461125e4,
+    1.9715909503065514427e3,
+    1.3314166789178437745e2,
+    3.3871328727963666080e0,
+]
+_b = [
+    5.2264952788528545610e3,
+    2.8729085735721942674e4,
+    3.9307895800092710610e4,
+    2.1213794301586595867e4,
+    5.3941960214247511077e3,
+    6.8718700749205790830e2,
+    4.2313330701600911252e1,
+    1.0,
+]
+_c = [
+    7.74545014278341407640e-4,
+    2.27238449892691845833e-2,
+    2.41780725177450611770e-1,
+    1.27045825245236838258e0,
+    3.64784832476320460504e0,
+    5.76949722146069140550e0,
+    4.63033784615654529590e0,
+    1.42343711074968357734e0,
+]
+_d = [
+    1.05075007164441684324e-9,
+    5.47593808499534494600e-4,
+    1.51986665636164571966e-2,
+    1.48103976427480074590e-1,
+    6.89767334985100004550e-1,
+    1.67638483018380384940e0,
+    2.05319162663775882187e0,
+    1.0,
+]
+_e = [
+    2.01033439929228813265e-7,
+    2.71155556874348757815e-5,
+    1.24266094738807843860e-3,
+    2.65321895265761230930e-2,
+    2.96560571828504891230e-1,
+    1.78482653991729133580e0,
+    5.46378491116411436990e0,
+    6.65790464350110377720e0,
+]
+_f = [
+    2.04426310338993978564e-15,
+    1.42151175831644588870e-7,
+    1.84631831751005468180e-5,
+    7.86869131145613259100e-4,
+    1.48753612908506148525e-2,
+    1.36929880922735805310e-1,
+    5.99832206555887937690e-1,
+    1.0,
+]
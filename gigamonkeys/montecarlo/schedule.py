@@ -1,7 +1,22 @@
 # Simple estimate: values are just ideal days.
 
+from collections import deque
+from dataclasses import dataclass
+from functools import reduce
+from operator import add
+from typing import Dict
+
+import numpy as np
+
+from gigamonkeys.montecarlo import Composite
 from gigamonkeys.montecarlo import CompositeSimulation
 from gigamonkeys.montecarlo import Named
+from gigamonkeys.montecarlo import NamedSummary
+from gigamonkeys.montecarlo import Null
+from gigamonkeys.montecarlo import Simulation
+from gigamonkeys.montecarlo import Tally
+from gigamonkeys.montecarlo import default_quantiles
+from gigamonkeys.montecarlo import distribution
 
 
 class Sequence(Named, CompositeSimulation):
@@ -9,7 +24,13 @@ class Sequence(Named, CompositeSimulation):
     "Children done in sequence."
 
     def combine_child_values(self, child_values):
-        return sum(child_values)
+        # Added strictly left to right (unlike sum, which compensates
+        # for rounding as of Python 3.12) so batches of values come
+        # out exactly the same as single values.
+        return reduce(add, child_values)
+
+    def combine_child_batches(self, child_batches):
+        return self.combine_child_values(child_batches)
 
 
 class Parallel(Named, CompositeSimulation):
@@ -19,6 +40,9 @@ class Parallel(Named, CompositeSimulation):
     def combine_child_values(self, child_values):
         return max(child_values)
 
+    def combine_child_batches(self, child_batches):
+        return np.maximum.reduce(child_batches)
+
 
 class OneOf(Named, CompositeSimulation):
 
@@ -26,3 +50,224 @@ class OneOf(Named, CompositeSimulation):
 
     def combine_child_values(self, child_values):
         return min(child_values)
+
+    def combine_child_batches(self, child_batches):
+        return np.minimum.reduce(child_batches)
+
+
+class DAG(Named, CompositeSimulation):
+
+    """
+    Tasks, our children, with dependencies. after maps the name of a
+    task to the names of the tasks that must finish before it can
+    start; tasks not in after can start right away. Each iteration the
+    tasks are scheduled as early as possible and our value is when the
+    last one finishes. Unlike a tree of Sequences and Parallels, a
+    task any number of others depend on is only simulated once per
+    iteration.
+
+    We also count how often each task is on the critical path, i.e.
+    the chain of tasks, each waiting on the one before, that ends with
+    the last to finish, and summarize those as each task's criticality
+    index.
+
+    Iterations are scheduled a task at a time in topological order,
+    by the vectorized engine as arrays of a whole batch, so it's much
+    faster for large graphs.
+    """
+
+    def __init__(self, children, after=None, **kwds):
+        super().__init__(children=children, after=after, **kwds)
+        self.after = after or {}
+        names = [c.name for c in children]
+        index = {n: i for i, n in enumerate(names)}
+        if len(index) != len(names):
+            raise ValueError(f"Duplicate task names in {self.name}")
+        for n, before in self.after.items():
+            for b in [n, *before]:
+                if b not in index:
+                    raise ValueError(f"Unknown task {b} in {self.name}")
+
+        # Tasks are scheduled in topological order, which we use as
+        # their index from here on.
+        self.order = topological_order(
+            names, {index[n]: [index[b] for b in bs] for n, bs in self.after.items()}
+        )
+        position = {task: i for i, task in enumerate(self.order)}
+        self.names = [names[task] for task in self.order]
+        self.predecessors = [
+            np.array(
+                sorted(position[index[b]] for b in self.after.get(n, ())), dtype=int
+            )
+            for n in self.names
+        ]
+        # The same as lists, for scheduling one iteration.
+        self.before = [list(map(int, p)) for p in self.predecessors]
+
+    def accumulator(self, store=None, record=None):
+        if self.recorded(record):
+            own = Critical(Simulation.accumulator(self, store))
+        else:
+            own = Null()
+        return Composite(own, [c.accumulator(store, record) for c in self.children])
+
+    def step(self, accumulator, **kwds):
+        # Scheduled without arrays as for one iteration they cost more
+        # than they save. Ties are broken as in schedule.
+        durations = self.step_children(accumulator.children, **kwds)
+        finish = []
+        waited_for = []
+        for task, before in zip(self.order, self.before):
+            duration = float(durations[task])
+            if before:
+                last = max(before, key=finish.__getitem__)
+                finish.append(finish[last] + duration)
+                waited_for.append(last)
+            else:
+                finish.append(duration)
+                waited_for.append(-1)
+
+        task = max(range(len(finish)), key=finish.__getitem__)
+        end = finish[task]
+        critical = accumulator.own
+        if not isinstance(critical, Null):
+            critical.finish.append(end)
+            while task >= 0:
+                critical.counts[self.names[task]] += 1
+                task = waited_for[task]
+        return end
+
+    def step_batch(self, accumulator, size, **kwds):
+        durations = self.step_children_batch(accumulator.children, size, **kwds)
+        return self.schedule(accumulator.own, np.array(durations, dtype=float))
+
+    def schedule(self, critical, durations):
+        """
+        Schedule the tasks given their durations, an array with a row
+        per child, accumulating the finish times and critical tasks
+        into critical. Returns the finish times.
+        """
+        durations = durations[self.order]
+        tasks, size = durations.shape
+        iterations = np.arange(size)
+        finish = np.empty_like(durations)
+        # The predecessor each task waited for, if any, to trace the
+        # critical path back from the end.
+        waited_for = np.full((tasks, size), -1, dtype=np.int32)
+
+        for task, before in enumerate(self.predecessors):
+            if len(before):
+                finishes = finish[before]
+                last = finishes.argmax(axis=0)
+                finish[task] = finishes[last, iterations] + durations[task]
+                waited_for[task] = before[last]
+            else:
+                finish[task] = durations[task]
+
+        task = finish.argmax(axis=0)
+        end = finish[task, iterations]
+        if isinstance(critical, Null):
+            return end
+
+        counts = np.zeros(tasks, dtype=int)
+        on_path = np.ones(size, dtype=bool)
+        while on_path.any():
+            np.add.at(counts, task[on_path], 1)
+            task = np.where(on_path, waited_for[task, iterations], -1)
+            on_path = task >= 0
+
+        self.accumulate_batch(critical.finish, end)
+        critical.counts.update(
+            {self.names[t]: n for t, n in enumerate(counts.tolist()) if n}
+        )
+        return end
+
+    def interval(self, accumulator):
+        return self.confidence_interval(accumulator.own.finish)
+
+    def summarize(self, accumulator):
+        own = accumulator.own
+        if isinstance(own, Null):
+            summary = None
+        else:
+            summary = DAGSummary(
+                self.confidence_interval(own.finish),
+                {n: own.counts[n] / len(own.finish) for n in self.names},
+            )
+        return NamedSummary(
+            self.name,
+            Composite(
+                summary,
+                [c.summarize(a) for c, a in zip(self.children, accumulator.children)],
+            ),
+        )
+
+    def describe(self, accumulator, ps=default_quantiles, bins=10):
+        own = accumulator.own
+        if isinstance(own, Null):
+            description = None
+        else:
+            description = DAGSummary(
+                distribution(own.finish, ps, bins),
+                {n: own.counts[n] / len(own.finish) for n in self.names},
+            )
+        return NamedSummary(
+            self.name,
+            Composite(
+                description,
+                [
+                    c.describe(a, ps, bins)
+                    for c, a in zip(self.children, accumulator.children)
+                ],
+            ),
+        )
+
+
+class Critical:
+
+    "Finish times of a DAG plus counts of how often each task was critical."
+
+    def __init__(self, finish):
+        self.finish = finish
+        self.counts = Tally()
+
+    def merge(self, other):
+        if isinstance(self.finish, list):
+            self.finish.extend(other.finish)
+        else:
+            self.finish.merge(other.finish)
+        self.counts.merge(other.counts)
+
+    def arrays(self):
+        return self.finish.arrays() if hasattr(self.finish, "arrays") else {}
+
+
+@dataclass
+class DAGSummary:
+    finish: object
+    criticality: Dict[str, float]
+
+
+def topological_order(names, after):
+    """
+    Indices of names such that every task comes after the ones it
+    depends on, per after, a dict from index to indices.
+    """
+    waiting = {i: len(set(after.get(i, ()))) for i in range(len(names))}
+    successors = {i: [] for i in range(len(names))}
+    for i, before in after.items():
+        for b in set(before):
+            successors[b].append(i)
+    ready = deque(i for i, n in waiting.items() if n == 0)
+    order = []
+    while ready:
+        i = ready.popleft()
+        order.append(i)
+        for s in successors[i]:
+            waiting[s] -= 1
+            if waiting[s] == 0:
+                ready.append(s)
+    if len(order) < len(names):
+        stuck = sorted(names[i] for i, n in waiting.items() if n > 0)
+        raise ValueError(f"Cycle among tasks {', '.join(stuck)}")
+    return order
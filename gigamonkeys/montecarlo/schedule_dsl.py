@@ -49,64 +49,98 @@ class Pipe(Tree):
     op: str = "|"
 
 
-def parse(lines):
-    return to_schedule(None, grouped(strip(lines)))
+class AST:
 
+    "Makes the nodes of the parse tree."
 
-def strip(lines):
-    def keep(s):
-        return s and s[0] != "#"
+    estimate = staticmethod(Leaf)
+    sequence = staticmethod(Plus)
+    parallel = staticmethod(Pipe)
 
-    return [line.rstrip() for line in lines if keep(line.strip())]
 
+class ParseError(Exception):
+    def __init__(self, lineno, message):
+        # Passing both args on to Exception lets it be pickled.
+        super().__init__(lineno, message)
+        self.lineno = lineno
+        self.message = message
 
-def grouped(lines):
-    groups = []
-    s = 0
-    while s < len(lines):
-        line = lines[s]
-        end = end_of_group(lines, s)
-        groups.append((line.strip(), grouped(lines[s + 1 : end])))
-        s = end
-    return groups
+    def __str__(self):
+        return f"line {self.lineno}: {self.message}"
 
 
-def end_of_group(lines, s):
-    indent = indentation(lines[s])
-    s += 1
-    while s < len(lines) and indentation(lines[s]) > indent:
-        s += 1
-    return s
+@dataclass
+class Frame:
+    "A line whose children we're still reading."
+    indent: int
+    op: str
+    name: str
+    lineno: int
+    children: List[object]
+
+
+def parse(lines, nodes=AST):
+    """
+    Parse the lines of a schedule, in one pass, into a tree made by
+    nodes, which has estimate, sequence, and parallel functions like
+    the calendar and deadline modules, to build simulations directly.
+    By default it makes the Leafs and Trees of the AST.
+
+    Each line is "+ name" or "| name" with its children, if any, on the
+    following, more indented, lines. The children of a + node are done
+    in sequence and those of a | node in parallel. Lines without
+    children are estimates, "+ name: low-high". Blank lines and lines
+    starting with # are skipped.
+    """
+    root = Frame(-1, None, None, 0, [])
+    stack = [root]
+    lineno = 0
+    for lineno, line in enumerate(lines, 1):
+        s = line.strip()
+        if not s or s[0] == "#":
+            continue
+        indent = indentation(line)
+        while stack[-1].indent >= indent:
+            finish(stack, nodes)
+        stack.append(Frame(indent, s[0], s[2:], lineno, []))
+
+    while len(stack) > 1:
+        finish(stack, nodes)
+    if not root.children:
+        raise ParseError(lineno, "Empty schedule")
+    return tree(root, nodes)
+
+
+def finish(stack, nodes):
+    "Make the node for the frame on top of the stack and add it to its parent."
+    frame = stack.pop()
+    node = tree(frame, nodes) if frame.children else estimate(frame, nodes)
+    stack[-1].children.append((frame.op, node))
+
+
+def tree(frame, nodes):
+    # As before, the first child's op says how the children are done.
+    op = frame.children[0][0]
+    make = nodes.sequence if op == "+" else nodes.parallel
+    return make(frame.name, [node for _, node in frame.children])
+
+
+def estimate(frame, nodes):
+    try:
+        name, estimate = frame.name.split(":")
+        low, high = map(int, estimate.strip().split("-"))
+    except ValueError:
+        raise ParseError(frame.lineno, f"Need estimate in leaf {frame.name}")
+    return nodes.estimate(name, low, high)
 
 
 def indentation(s):
     for i in range(len(s)):
         if s[i] != " ":
             return i
-    # Technically this can't actually happen since we've already
-    # removed blank lines.
     return len(s)
 
 
-def to_schedule(name, group):
-    children = [node(x) for x in group]
-    if not children:
-        try:
-            name, estimate = name.split(":")
-        except Exception:
-            raise Exception(f"Need estimate in leaf {name}")
-        low, high = map(int, estimate.strip().split("-"))
-        return Leaf(name, low, high)
-    else:
-        op = group[0][0][0]
-        return Tree.fromOp(op)(name, children)
-
-
-def node(x):
-    name, children = x
-    return to_schedule(name[2:], children)
-
-
 if __name__ == "__main__":
 
     with open("foo.txt") as f:
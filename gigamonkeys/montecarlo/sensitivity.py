@@ -0,0 +1,150 @@
+# Which estimates drive the uncertainty of a schedule, as for a tornado
+# chart, computed from the values a run already accumulated rather than
+# by re-running with each estimate pinned. Every node's accumulator
+# holds its value from each iteration in the same order, so the values
+# of each leaf line up with the root's and we can rank correlate them.
+#
+#   acc = s.simulate(10_000, seed=0, engine="vectorized")
+#   for leaf in sensitivity(s, acc, outcome="end"):
+#       print(leaf.name, leaf.correlation, leaf.contribution)
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from gigamonkeys.montecarlo import CompositeSimulation
+from gigamonkeys.montecarlo import Null
+from gigamonkeys.montecarlo.columnar import Column
+from gigamonkeys.montecarlo.columnar import Table
+
+
+@dataclass
+class Sensitivity:
+
+    """
+    How one leaf's values relate to the root's. The correlation is
+    Spearman's rank correlation and the contribution is the leaf's
+    share of the root's variance, estimated as its squared correlation
+    over the sum of all the leaves' squared correlations.
+    """
+
+    name: Optional[str]
+    path: Tuple[int, ...]
+    correlation: float
+    contribution: float
+
+
+def sensitivity(simulation, accumulator, outcome="days"):
+    """
+    The Sensitivity of the root to each leaf that was recorded, biggest
+    first. Where values are records, as in calendar and deadline nodes,
+    leaves are compared by their days and the root by the attribute
+    named by outcome, e.g. "end" to see what drives the end date. The
+    accumulators need every iteration's values, in order, so simulate
+    with no store or store=Column.
+    """
+    root = samples(accumulator, outcome)
+    if root is None:
+        raise ValueError("Sensitivity needs the root's values recorded")
+
+    names, paths, values = [], [], []
+    for node, path, acc in leaves(simulation, accumulator):
+        v = samples(acc, "days")
+        if v is not None:
+            if len(v) != len(root):
+                raise ValueError("Leaf and root values aren't aligned")
+            names.append(getattr(node, "name", None))
+            paths.append(path)
+            values.append(v)
+
+    correlations = spearman(np.array(values).reshape(len(values), len(root)), root)
+    squares = correlations ** 2
+    total = squares.sum()
+    contributions = squares / total if total else squares
+    result = [
+        Sensitivity(n, p, float(c), float(v))
+        for n, p, c, v in zip(names, paths, correlations, contributions)
+    ]
+    return sorted(result, key=lambda s: abs(s.correlation), reverse=True)
+
+
+def spearman(leaves, root):
+    """
+    The rank correlation of each row of leaves with root, leaving out
+    the iterations where either is NaN.
+    """
+    result = np.zeros(len(leaves))
+    # Usually nothing is NaN and all the leaves can be done at once.
+    whole = ~np.isnan(leaves).any(axis=1) & ~np.isnan(root).any()
+    if whole.any():
+        result[whole] = correlations(ranks(leaves[whole]), ranks(root))
+    for i in np.flatnonzero(~whole):
+        ok = ~(np.isnan(leaves[i]) | np.isnan(root))
+        result[i] = correlations(ranks(leaves[i][ok])[None], ranks(root[ok]))[0]
+    return result
+
+
+def correlations(xs, y):
+    "The Pearson correlation of each row of xs with y."
+    xs = xs - xs.mean(axis=1, keepdims=True)
+    y = y - y.mean()
+    denominator = np.sqrt((xs ** 2).sum(axis=1) * (y ** 2).sum())
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nan_to_num(xs @ y / denominator)
+
+
+def ranks(values):
+    "Ranks along the last axis, with ties given their average rank."
+    if values.ndim > 1:
+        return np.array([ranks(v) for v in values])
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return (np.cumsum(counts) - (counts + 1) / 2)[inverse]
+
+
+def leaves(simulation, accumulator, path=()):
+    "Generate each leaf with its path and accumulator."
+    if isinstance(simulation, CompositeSimulation):
+        for i, (c, a) in enumerate(zip(simulation.children, accumulator.children)):
+            yield from leaves(c, a, path + (i,))
+    else:
+        yield simulation, path, accumulator
+
+
+def samples(accumulator, key):
+    """
+    A node's values, one per iteration, as floats with NaN for None and
+    dates as ordinals, or None if they weren't recorded.
+    """
+    own = getattr(accumulator, "own", accumulator)
+    own = getattr(own, "finish", own)
+    if isinstance(own, Null):
+        return None
+    elif isinstance(own, Column):
+        return own.values.astype(float)
+    elif isinstance(own, Table):
+        column = own.columns[key].values.astype(float)
+        if key in own.dates:
+            column[column == 0] = np.nan
+        elif key in own.integers:
+            column[own.columns[key].values == Table.missing] = np.nan
+        return column
+    elif isinstance(own, list):
+        if own and hasattr(own[0], key):
+            own = [getattr(step, key) for step in own]
+        return np.array([number(x) for x in own], dtype=float)
+    else:
+        raise ValueError(
+            f"Can't get every iteration's values from a {type(own).__name__}"
+        )
+
+
+def number(x):
+    if x is None:
+        return np.nan
+    elif isinstance(x, date):
+        return x.toordinal()
+    else:
+        return x
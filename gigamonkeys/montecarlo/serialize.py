@@ -0,0 +1,145 @@
+# Writing summaries, i.e. trees of NamedSummary, Composite, and other
+# dataclasses holding dicts, tuples, numbers, and dates, as JSON. This
+# gives the same JSON as json.dump(asdict(summary)) with dates as ISO
+# strings but walks the tree in place rather than copying it first and
+# writes the text out in chunks as it goes.
+
+from dataclasses import fields
+from dataclasses import is_dataclass
+from datetime import date
+from json.encoder import encode_basestring
+
+import numpy as np
+
+# Pieces of text to collect before writing them out in one go.
+chunk_size = 4096
+
+# The names of the fields of each dataclass, by class.
+field_names = {}
+
+
+def dump(summary, fp, indent=None):
+    """
+    Write summary as JSON to fp, anything with a write method taking
+    strings, e.g. a file or a socket's makefile("w"). With an indent,
+    pretty print it like json.dump; without, write it as compactly as
+    possible.
+    """
+    writer = Writer(fp.write, indent)
+    writer.value(summary, 0)
+    writer.flush()
+
+
+def dumps(summary, indent=None):
+    "The JSON text of summary, as dump would write it."
+    parts = []
+    writer = Writer(parts.append, indent)
+    writer.value(summary, 0)
+    writer.flush()
+    return "".join(parts)
+
+
+class Writer:
+
+    "Encodes values into pieces of text, passing them to write in chunks."
+
+    def __init__(self, write, indent=None):
+        self.write = write
+        self.indent = indent
+        self.key_separator = ":" if indent is None else ": "
+        self.parts = []
+        self.emit = self.parts.append
+
+    def flush(self):
+        self.write("".join(self.parts))
+        self.parts.clear()
+
+    def check(self):
+        "Write out the pieces so far if there are enough of them."
+        if len(self.parts) >= chunk_size:
+            self.flush()
+
+    def newline(self, depth):
+        if self.indent is not None:
+            self.emit("\n" + " " * (self.indent * depth))
+
+    def value(self, o, depth):
+        if isinstance(o, str):
+            self.emit(encode_basestring(o))
+        elif o is None or isinstance(o, (bool, int, float, np.generic)):
+            self.emit(scalar(o))
+        elif isinstance(o, date):
+            self.emit('"' + o.isoformat() + '"')
+        elif isinstance(o, dict):
+            self.items(o.items(), depth)
+        elif isinstance(o, (list, tuple, np.ndarray)):
+            self.array(o, depth)
+        elif is_dataclass(o):
+            self.items(((name, getattr(o, name)) for name in names(o)), depth)
+        else:
+            raise TypeError(f"Can't write {type(o).__name__} as JSON")
+
+    def items(self, items, depth):
+        empty = True
+        for k, v in items:
+            self.emit("{" if empty else ",")
+            empty = False
+            self.newline(depth + 1)
+            self.emit(key(k))
+            self.emit(self.key_separator)
+            self.value(v, depth + 1)
+            self.check()
+        if empty:
+            self.emit("{}")
+        else:
+            self.newline(depth)
+            self.emit("}")
+
+    def array(self, values, depth):
+        if len(values) == 0:
+            self.emit("[]")
+            return
+        for i, v in enumerate(values):
+            self.emit("," if i else "[")
+            self.newline(depth + 1)
+            self.value(v, depth + 1)
+            self.check()
+        self.newline(depth)
+        self.emit("]")
+
+
+def names(o):
+    cls = type(o)
+    if cls not in field_names:
+        field_names[cls] = tuple(f.name for f in fields(cls))
+    return field_names[cls]
+
+
+def scalar(o):
+    "The JSON text of None, a bool, or a number, as json writes them."
+    if isinstance(o, np.generic):
+        o = o.item()
+    if o is None:
+        return "null"
+    elif o is True:
+        return "true"
+    elif o is False:
+        return "false"
+    elif isinstance(o, int):
+        return int.__repr__(o)
+    elif o != o:
+        return "NaN"
+    elif o in (float("inf"), float("-inf")):
+        return "Infinity" if o > 0 else "-Infinity"
+    else:
+        return float.__repr__(o)
+
+
+def key(k):
+    "The JSON text of a dict key, which JSON needs to be a string."
+    if isinstance(k, str):
+        return encode_basestring(k)
+    elif isinstance(k, date):
+        return '"' + k.isoformat() + '"'
+    else:
+        return '"' + scalar(k) + '"'
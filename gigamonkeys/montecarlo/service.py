@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# A long-lived local service that simulates schedules on request, so
+# callers don't pay for starting Python and importing numpy on every
+# run. Clients connect over a Unix socket or TCP and send requests, one
+# JSON object per line; each result is written back as one line of JSON
+# as soon as it's done, which needn't be in the order asked. The runs
+# happen in a pool of worker processes started, and warmed up, with the
+# service, and identical requests that arrive while the first is still
+# running share its run.
+#
+# A request holds the schedule, as schedule DSL text or a JSON tree, and
+# how to run it:
+#
+#   {"id": 1, "schedule": "+ a: 5-10\n+ b: 3-4", "kind": "deadline",
+#    "start": "2020-06-01", "due_date": "2020-07-01",
+#    "holidays": ["2020-07-03"], "iters": 10000, "seed": 0}
+#
+# Run it with:
+#
+#   python -m gigamonkeys.montecarlo.service --socket /tmp/montecarlo.sock
+#
+# A JSON tree is {"name": ..., "op": "+" or "|", "children": [...]} with
+# {"name": ..., "low": ..., "high": ...} leaves, which may also give a
+# "distribution" and "mode" as for Estimate. The reply is
+# {"id": 1, "result": ...} or {"id": 1, "error": "..."}. A request
+# giving until_precision rather than iters gets a result of
+# {"summary": ..., "iterations": ...}.
+
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from gigamonkeys.montecarlo import calendar
+from gigamonkeys.montecarlo import deadline
+from gigamonkeys.montecarlo.calendar import Calendar
+from gigamonkeys.montecarlo.calendar import parse_date
+from gigamonkeys.montecarlo.schedule_dsl import parse
+from gigamonkeys.montecarlo.serialize import dumps
+
+kinds = {"calendar": calendar, "deadline": deadline}
+
+# Request fields passed as is to Simulation.run. Unlike run, the
+# engine defaults to vectorized.
+run_args = ("seed", "engine", "sampling", "until_precision", "max_iters")
+
+
+class Service:
+
+    "Runs requests in a pool of workers, merging identical ones in flight."
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.pool = ProcessPoolExecutor(self.workers)
+        # The running future for each distinct request.
+        self.running = {}
+
+    async def warm(self):
+        "Start the workers and have each do a small run."
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[loop.run_in_executor(self.pool, warm) for _ in range(self.workers)]
+        )
+
+    async def result(self, request):
+        "The JSON text of the result of request."
+        args = {k: v for k, v in request.items() if k != "id"}
+        key = json.dumps(args, sort_keys=True)
+        if key not in self.running:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, run, request)
+            self.running[key] = future
+            future.add_done_callback(lambda _: self.running.pop(key, None))
+        return await self.running[key]
+
+    async def reply(self, line, writer, lock):
+        request = None
+        try:
+            request = json.loads(line)
+            text = response(request, await self.result(request))
+        except Exception as e:
+            text = failure(request, e)
+        async with lock:
+            writer.write(text.encode() + b"\n")
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        "Answer each request on a connection as soon as its result is ready."
+        lock = asyncio.Lock()
+        replies = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                replies.append(asyncio.ensure_future(self.reply(line, writer, lock)))
+        await asyncio.gather(*replies)
+        writer.close()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def run(request):
+    "Run request, in a worker process, returning the JSON text of the result."
+    simulation, iters, kwds = build(request)
+    if "until_precision" in kwds:
+        summary, iterations = simulation.run(iters, **kwds)
+        return dumps({"summary": summary, "iterations": iterations})
+    return dumps(simulation.run(iters, **kwds))
+
+
+def build(request):
+    "The simulation, iterations, and other args of Simulation.run for a request."
+    try:
+        nodes = kinds[request.get("kind", "calendar")]
+    except KeyError:
+        raise ValueError(f"Unknown kind {request['kind']}")
+    if "schedule" in request:
+        simulation = parse(request["schedule"].splitlines(), nodes)
+    elif "tree" in request:
+        simulation = from_json(request["tree"], nodes)
+    else:
+        raise ValueError("Need schedule or tree")
+
+    c = calendar_with(tuple(request.get("holidays", ())))
+    start = parse_date(request["start"]) if "start" in request else c.today()
+    kwds = {"start": start, "calendar": c, "engine": "vectorized"}
+    if "due_date" in request:
+        kwds["due_date"] = parse_date(request["due_date"])
+    kwds.update({k: request[k] for k in run_args if k in request})
+    iters = request.get("iters", None if "until_precision" in kwds else 10_000)
+    return simulation, iters, kwds
+
+
+@lru_cache(maxsize=32)
+def calendar_with(holidays):
+    "A calendar with the given ISO dates off, shared by requests with the same."
+    return Calendar({parse_date(d) for d in holidays})
+
+
+def response(request, result):
+    "The reply line to request given the JSON text of its result."
+    return f'{{"id": {json.dumps(request.get("id"))}, "result": {result}}}'
+
+
+def failure(request, e):
+    "The reply line to request, which may not have been parsed, given error e."
+    id = request.get("id") if isinstance(request, dict) else None
+    return json.dumps({"id": id, "error": f"{type(e).__name__}: {e}"})
+
+
+def from_json(tree, nodes):
+    "Make a simulation from a JSON tree with nodes, e.g. the deadline module."
+    if "children" in tree:
+        make = nodes.sequence if tree.get("op", "+") == "+" else nodes.parallel
+        return make(tree.get("name"), [from_json(c, nodes) for c in tree["children"]])
+    else:
+        shape = {k: tree[k] for k in ("distribution", "mode") if k in tree}
+        return nodes.estimate(tree["name"], tree["low"], tree["high"], **shape)
+
+
+def warm():
+    run({"schedule": "+ a: 1-2\n| b: 1-2", "iters": 100})
+
+
+async def serve(service, path=None, host="127.0.0.1", port=None):
+    await service.warm()
+    if path is not None:
+        server = await asyncio.start_unix_server(service.handle, path)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Simulate schedules on request.")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--socket", help="Unix socket to listen on")
+    where.add_argument("--port", type=int, help="TCP port to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--workers", type=int, help="worker processes")
+    args = parser.parse_args()
+
+    service = Service(args.workers)
+    try:
+        asyncio.run(serve(service, args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,109 @@
+# Bounded memory stores for accumulating values. Pass the class, or a
+# functools.partial of it, as the store argument to Simulation.run.
+
+from bisect import bisect_right
+from itertools import accumulate
+from math import ceil
+from random import Random
+
+import numpy as np
+
+
+class KLL:
+
+    """
+    Mergeable quantile sketch from Karnin, Lang & Liberty, "Optimal
+    Quantile Approximation in Streams" (2016).
+
+    Values are kept in a stack of compactors. When the stack is full
+    the lowest full compactor is sorted and every other value is
+    promoted to the next level with twice the weight, so the sketch
+    never holds more than about 3k values plus one per level no
+    matter how many it has seen. The k largest compactors hold at
+    most k values and lower levels shrink geometrically by 2/3.
+
+    Error: select(ranks) returns values whose true rank is within
+    about 1.7/k * n of the requested rank with 99% probability, i.e.
+    roughly 0.85% of n for the default k=200 and 0.2% for k=800.
+    Merging sketches, e.g. from different workers, doesn't add error
+    beyond that of one sketch of all the values.
+
+    Compaction coin flips come from a fixed seed so the same values
+    appended and merged in the same order always give the same sketch.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.random = Random(seed)
+        self.compactors = [[]]
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def capacity(self, level):
+        height = len(self.compactors) - level - 1
+        return int(ceil(self.k * (2 / 3) ** height)) + 1
+
+    def append(self, x):
+        self.compactors[0].append(x)
+        self.n += 1
+        self.compress()
+
+    def extend(self, xs):
+        before = len(self.compactors[0])
+        self.compactors[0].extend(xs)
+        self.n += len(self.compactors[0]) - before
+        self.compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for mine, theirs in zip(self.compactors, other.compactors):
+            mine.extend(theirs)
+        self.n += other.n
+        self.compress()
+
+    def compress(self):
+        "Compact levels, lowest first, until we're back under capacity."
+        while self.size() >= self.max_size():
+            for level, compactor in enumerate(self.compactors):
+                if len(compactor) >= self.capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    self.compactors[level + 1].extend(self.compact(compactor))
+                    break
+
+    def compact(self, compactor):
+        "Empty compactor, except for any odd one out, returning every other value."
+        compactor.sort()
+        keep = [compactor.pop()] if len(compactor) % 2 else []
+        promoted = compactor[self.random.randrange(2) :: 2]
+        compactor[:] = keep
+        return promoted
+
+    def size(self):
+        return sum(len(c) for c in self.compactors)
+
+    def max_size(self):
+        return sum(self.capacity(level) for level in range(len(self.compactors)))
+
+    def weighted(self):
+        "Arrays of the values held and how many values each stands for."
+        values = [x for compactor in self.compactors for x in compactor]
+        weights = [
+            2 ** level
+            for level, compactor in enumerate(self.compactors)
+            for _ in compactor
+        ]
+        return np.array(values), np.array(weights)
+
+    def select(self, ranks):
+        "Approximate values at the given ranks, as if all n values were sorted."
+        weighted = sorted(
+            (x, 2 ** level)
+            for level, compactor in enumerate(self.compactors)
+            for x in compactor
+        )
+        cumulative = list(accumulate(w for _, w in weighted))
+        return [weighted[bisect_right(cumulative, r)][0] for r in ranks]
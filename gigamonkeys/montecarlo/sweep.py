@@ -0,0 +1,199 @@
+# The probability of a deadline schedule completing on time as the
+# start date or due date varies, e.g. to chart P(on time) against the
+# due date, without a run per date.
+#
+# With no due date in the way, each node of an iteration has a first
+# due date by which it completes: the day after its last leaf starts or
+# the day its last leaf ends, if later. Before any node fails to
+# complete, everything starts and ends just as it would with no due
+# date, so the node completes by a due date exactly when the due date
+# is on or after that threshold. So one run with no due date per start
+# date gives every node's P(complete) at any number of due dates, and
+# the estimates are drawn once and reused for every start date. Each
+# point gives the same result as a vectorized run with that start and
+# due date and the same seed.
+#
+#   due_dates = [start + timedelta(days=d) for d in range(30, 90)]
+#   s = sweep(schedule, 10_000, calendar, start, due_dates, seed=0)
+#   s.curves  # NamedSummary tree of P(complete) at each due date
+
+from dataclasses import dataclass
+from datetime import date
+from typing import List
+
+import numpy as np
+
+from gigamonkeys.montecarlo import Composite
+from gigamonkeys.montecarlo import CompositeSimulation
+from gigamonkeys.montecarlo import NamedSummary
+from gigamonkeys.montecarlo import Null
+from gigamonkeys.montecarlo import batch_size
+from gigamonkeys.montecarlo import spawn
+from gigamonkeys.montecarlo.plan import compile
+from gigamonkeys.montecarlo.sampling import Sampler
+
+# A due date nothing reaches.
+never = date.max.toordinal()
+
+
+@dataclass
+class Sweep:
+
+    """
+    The points swept, as pairs of start and due dates, and a tree like
+    a summary with, for each node, the proportion of iterations it
+    completed by the due date at each point.
+    """
+
+    starts: List[date]
+    due_dates: List[date]
+    iterations: int
+    curves: object
+
+
+def sweep(simulation, iters, calendar, start, due_date, seed=None, sampling="random"):
+    """
+    Simulate iters iterations of simulation, a deadline schedule, for
+    each point of a sweep. Either or both of start and due_date may be
+    a sequence of dates; if both are they're paired up. It costs about
+    one vectorized run per distinct start date, however many due dates.
+    """
+    starts, due_dates = points(start, due_date)
+    distinct = sorted(set(starts))
+    n = len(distinct)
+    ordinals = np.array([d.toordinal() for d in distinct], dtype=np.int64)
+
+    acc = simulation.accumulator(ThresholdStore(n))
+    plan = compile(simulation)
+    seeds = np.random.SeedSequence(seed)
+    for i, begin in enumerate(range(0, iters, batch_size)):
+        size = min(batch_size, iters - begin)
+        simulation.reseed(spawn(seeds, i), Repeating(sampling, size, n))
+        # Iterations laid out start by start, each with the same draws.
+        plan.step_batch(
+            acc,
+            size * n,
+            start=np.repeat(ordinals, size),
+            due_date=never,
+            calendar=calendar,
+        )
+
+    rows = np.array([distinct.index(s) for s in starts])
+    due = np.array([d.toordinal() for d in due_dates], dtype=np.int64)
+    tree, _ = curves(simulation, acc, rows, due)
+    return Sweep(starts, due_dates, iters, tree)
+
+
+def points(start, due_date):
+    "The start and due dates of each point of the sweep."
+    starts = [start] if isinstance(start, date) else list(start)
+    due_dates = [due_date] if isinstance(due_date, date) else list(due_date)
+    if len(starts) == 1:
+        starts *= len(due_dates)
+    elif len(due_dates) == 1:
+        due_dates *= len(starts)
+    elif len(starts) != len(due_dates):
+        raise ValueError("Need as many start dates as due dates to pair them")
+    return starts, due_dates
+
+
+def curves(simulation, accumulator, rows, due):
+    """
+    A tree of the P(complete) curve of each node, given the row of
+    thresholds of each point's start date and its due date ordinal,
+    along with the node's thresholds, a row per start date.
+    """
+    name = getattr(simulation, "name", None)
+    if isinstance(simulation, CompositeSimulation):
+        children, child_thresholds = zip(
+            *[
+                curves(c, a, rows, due)
+                for c, a in zip(simulation.children, accumulator.children)
+            ]
+        )
+        # A composite completes when all its children do.
+        thresholds = np.maximum.reduce(child_thresholds)
+        curve = completed(thresholds, rows, due)
+        return NamedSummary(name, Composite(curve, list(children))), thresholds
+    elif isinstance(accumulator, Thresholds):
+        thresholds = accumulator.values()
+        return NamedSummary(name, completed(thresholds, rows, due)), thresholds
+    else:
+        raise ValueError(f"Can't sweep a {type(simulation).__name__}")
+
+
+def completed(thresholds, rows, due):
+    "The proportion of each row's thresholds on or before the due date."
+    ordered = np.sort(thresholds, axis=1)
+    counts = [np.searchsorted(ordered[r], d, "right") for r, d in zip(rows, due)]
+    return (np.array(counts) / thresholds.shape[1]).tolist()
+
+
+class Thresholds:
+
+    """
+    The first due date, as an ordinal, by which each iteration of a
+    node stepped with no due date completes, for each start date.
+    """
+
+    takes_arrays = True
+
+    def __init__(self, starts):
+        self.starts = starts
+        self.batches = []
+
+    def __len__(self):
+        return sum(b.shape[1] for b in self.batches)
+
+    def extend_batch(self, batch):
+        # Starting on the due date doesn't count as completing by it.
+        t = np.maximum(batch.end, batch.start + 1)
+        self.batches.append(t.reshape(self.starts, -1))
+
+    def merge(self, other):
+        self.batches.extend(other.batches)
+
+    def values(self):
+        return np.concatenate(self.batches, axis=1)
+
+
+class ThresholdStore:
+
+    "A store making Thresholds for deadline nodes and keeping nothing else."
+
+    def __init__(self, starts):
+        self.starts = starts
+
+    def __call__(self):
+        return Null()
+
+    def records(self, keys, dates=(), categories=(), integers=()):
+        return Thresholds(self.starts)
+
+
+class Repeating(Sampler):
+
+    "A Sampler whose streams repeat each draw for every start date."
+
+    def __init__(self, method, size, times):
+        super().__init__(method, size)
+        self.times = times
+
+    def stream(self, rng, method=None):
+        return Repeated(super().stream(rng, method), self.times)
+
+
+class Repeated:
+
+    "A stream giving the values of another repeated times times over."
+
+    def __init__(self, stream, times):
+        self.stream = stream
+        self.times = times
+        self.draws = 0
+
+    def normals(self, size):
+        return np.tile(self.stream.normals(size // self.times), self.times)
+
+    def uniforms(self, size):
+        return np.tile(self.stream.uniforms(size // self.times), self.times)
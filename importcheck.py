@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# Check that importing the simulation modules stays cheap for short
+# lived runs: they mustn't import modules that are slow to import and
+# only needed by some runs, such as pendulum or multiprocessing, and
+# the time each takes to import on top of numpy, i.e. our own modules
+# and whatever else they import, must stay within a budget. Exits
+# non-zero if not.
+#
+# The budget is a fraction of numpy's import time in the same run so
+# it holds on slower and faster machines alike. Numpy itself is a
+# deliberate cost: every run needs it, as the seeds and the vectorized
+# engine are built on it.
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+modules = [
+    "gigamonkeys.montecarlo",
+    "gigamonkeys.montecarlo.calendar",
+    "gigamonkeys.montecarlo.deadline",
+    "gigamonkeys.montecarlo.schedule",
+]
+
+# Only imported when actually needed.
+forbidden = ["pendulum", "multiprocessing", "concurrent.futures.process", "asyncio"]
+
+
+def import_times(module):
+    """
+    The microseconds importing each module took, including the modules
+    it imported, when importing module in a fresh interpreter.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in out.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, total, name = line[len("import time:") :].split("|")
+            if total.strip().isdigit():
+                times[name.strip()] = int(total)
+    return times
+
+
+def cost(times, module):
+    "The time importing module took on top of numpy, as a fraction of numpy's."
+    return (times[module] - times["numpy"]) / times["numpy"]
+
+
+def check(budget, runs):
+    ok = True
+    for module in modules:
+        samples = [import_times(module) for _ in range(runs)]
+        # The median of a few runs to filter out noise.
+        ours = statistics.median(cost(times, module) for times in samples)
+        numpy = statistics.median(times["numpy"] for times in samples) / 1000
+        imported = [name for name in forbidden if name in samples[0]]
+        print(f"{module:<36} {ours:5.0%} of numpy's {numpy:.1f}ms on top of it")
+        if imported:
+            ok = False
+            print(f"  imports {', '.join(imported)}")
+        if ours > budget:
+            ok = False
+            print(f"  over the budget of {budget:.0%}")
+    return ok
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check import times.")
+    parser.add_argument(
+        "--budget", type=float, default=0.75, help="fraction of numpy's time"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.exit(0 if check(args.budget, args.runs) else 1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Checks that re-running a tree with a Memo after editing one leaf
+# reuses the values of the rest and gives the same results as running
+# it from scratch. Run directly or with pytest.
+
+import warnings
+from datetime import date
+
+from gigamonkeys.montecarlo import calendar
+from gigamonkeys.montecarlo.calendar import Calendar
+from gigamonkeys.montecarlo.columnar import Column
+from gigamonkeys.montecarlo.memo import Memo
+
+iters = 20_000
+
+args = dict(
+    engine="vectorized",
+    store=Column,
+    seed=0,
+    start=date(2020, 6, 1),
+    calendar=Calendar(set()),
+)
+
+
+def tree(high=5):
+    "Parallel sequences whose first leaf has the given high estimate."
+    return calendar.parallel(
+        "Root",
+        [
+            calendar.sequence(
+                f"S{i}",
+                [
+                    calendar.estimate(f"T{i}.{j}", 1, high if i == j == 0 else 5)
+                    for j in range(4)
+                ],
+            )
+            for i in range(4)
+        ],
+    )
+
+
+def rerun_after_edit(memo):
+    "Run the tree, edit one leaf, and re-run it, checking the result."
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        tree().simulate(iters, memo=memo, **args)
+        memo.hits = memo.misses = 0
+        edited = tree(high=9)
+        acc = edited.simulate(iters, memo=memo, **args)
+    expected = tree(high=9)
+    assert edited.summarize(acc) == expected.summarize(expected.simulate(iters, **args))
+    return caught
+
+
+def test_edit_one_leaf():
+    memo = Memo()
+    assert not rerun_after_edit(memo)
+    assert memo.hits > 0
+
+
+def test_run_bigger_than_memo():
+    whole = Memo()
+    tree().simulate(iters, memo=whole, **args)
+    memo = Memo(max_bytes=whole.bytes // 2)
+    caught = rerun_after_edit(memo)
+    assert memo.hits > 0
+    assert caught
+    assert memo.bytes <= memo.max_bytes
+
+
+if __name__ == "__main__":
+
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# Checks that the schedule DSL parses into the trees it should and
+# reports errors on the right lines. Run directly or with pytest.
+
+from datetime import date
+
+import pytest
+
+from gigamonkeys.montecarlo import calendar
+from gigamonkeys.montecarlo import deadline
+from gigamonkeys.montecarlo.calendar import Calendar
+from gigamonkeys.montecarlo.schedule_dsl import Leaf
+from gigamonkeys.montecarlo.schedule_dsl import ParseError
+from gigamonkeys.montecarlo.schedule_dsl import Pipe
+from gigamonkeys.montecarlo.schedule_dsl import Plus
+from gigamonkeys.montecarlo.schedule_dsl import parse
+
+text = """\
+# A project.
++ Project
+  + Build
+    + Design: 2-4
+
+    + Code: 5-10
+# Back out to the project's children, not the top.
+  | Launch
+    # Both at once.
+    | Docs: 1-3
+    | Marketing: 3-6
+  + Party: 1-2
+"""
+
+
+def lines(s):
+    return s.splitlines()
+
+
+def built(m):
+    "The tree in text, made with the functions of module m."
+    return m.sequence(
+        None,
+        [
+            m.sequence(
+                "Project",
+                [
+                    m.sequence(
+                        "Build", [m.estimate("Design", 2, 4), m.estimate("Code", 5, 10)]
+                    ),
+                    m.parallel(
+                        "Launch",
+                        [m.estimate("Docs", 1, 3), m.estimate("Marketing", 3, 6)],
+                    ),
+                    m.estimate("Party", 1, 2),
+                ],
+            )
+        ],
+    )
+
+
+def test_ast():
+    assert parse(lines(text)) == Plus(
+        None,
+        [
+            Plus(
+                "Project",
+                [
+                    Plus("Build", [Leaf("Design", 2, 4), Leaf("Code", 5, 10)]),
+                    Pipe("Launch", [Leaf("Docs", 1, 3), Leaf("Marketing", 3, 6)]),
+                    Leaf("Party", 1, 2),
+                ],
+            )
+        ],
+    )
+
+
+def test_nodes():
+    kwds = dict(seed=0, start=date(2020, 6, 1), calendar=Calendar(set()))
+    for m, extra in ((calendar, {}), (deadline, dict(due_date=date(2020, 7, 1)))):
+        expected = built(m).run(1000, **kwds, **extra)
+        assert parse(lines(text), m).run(1000, **kwds, **extra) == expected
+
+
+def error_line(s):
+    with pytest.raises(ParseError) as e:
+        parse(lines(s))
+    return e.value.lineno
+
+
+def test_errors():
+    assert error_line("+ A\n\n# No estimate.\n  + b\n  + c: 1-2\n") == 4
+    assert error_line("+ A\n  + b: 1-2\n  + c: 1-x\n") == 3
+    assert error_line("+ A\n  + b: 1-2\n  + c: 3\n") == 3
+    assert error_line("# Nothing.\n\n") == 2
+
+
+if __name__ == "__main__":
+
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Checks that each point of a sweep gives the same P(complete), node by
+# node, as a vectorized run with that start and due date and the same
+# seed. Run directly or with pytest.
+
+from datetime import date
+from datetime import timedelta
+
+from gigamonkeys.montecarlo import Composite
+from gigamonkeys.montecarlo import deadline
+from gigamonkeys.montecarlo.calendar import Calendar
+from gigamonkeys.montecarlo.sweep import sweep
+
+iters = 8_000
+
+start = date(2020, 6, 29)
+
+days_off = Calendar({date(2020, 7, 3), date(2020, 7, 20)})
+
+
+def tree():
+    return deadline.sequence(
+        "Root",
+        [
+            deadline.estimate("a", 4, 10),
+            deadline.parallel(
+                "p",
+                [
+                    deadline.estimate("b", 8, 14, distribution="pert", mode=9),
+                    deadline.sequence(
+                        "s",
+                        [deadline.estimate("c", 3, 6), deadline.estimate("d", 2, 4)],
+                    ),
+                ],
+            ),
+            deadline.estimate("e", 3, 5, distribution="lognormal"),
+        ],
+    )
+
+
+def completed(summary):
+    "The proportion of iterations each node completed, depth first."
+    s = summary.summary
+    if isinstance(s, Composite):
+        own = [s.own.summary.get("COMPLETE", 0)]
+        return own + [p for c in s.children for p in completed(c)]
+    else:
+        return [s.get("COMPLETE", 0)]
+
+
+def curves(summary):
+    "The curve of each node of a sweep, depth first."
+    s = summary.summary
+    if isinstance(s, Composite):
+        return [s.own] + [curve for c in s.children for curve in curves(c)]
+    else:
+        return [s]
+
+
+def same_as_runs(starts, due_dates, sampling):
+    s = tree()
+    swept = sweep(s, iters, days_off, starts, due_dates, seed=3, sampling=sampling)
+    points = list(zip(*curves(swept.curves)))
+    assert len(points) == len(swept.starts) == len(swept.due_dates)
+    for begin, due, point in zip(swept.starts, swept.due_dates, points):
+        r = s.run(
+            iters,
+            seed=3,
+            engine="vectorized",
+            sampling=sampling,
+            start=begin,
+            due_date=due,
+            calendar=days_off,
+        )
+        assert list(point) == completed(r), (begin, due, sampling)
+
+
+def test_due_dates():
+    due_dates = [start + timedelta(days=d) for d in (-1, 0, 10, 21, 26, 35)]
+    for sampling in ("random", "lhs", "halton"):
+        same_as_runs(start, due_dates, sampling)
+
+
+def test_start_dates():
+    starts = [start + timedelta(days=d) for d in (-7, 0, 4, 5)]
+    for sampling in ("random", "lhs", "halton"):
+        same_as_runs(starts, start + timedelta(days=30), sampling)
+
+
+if __name__ == "__main__":
+
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -1,8 +1,5 @@
 #!/usr/bin/env python
-import datetime
-import json
 import sys
-from dataclasses import asdict
 
 from gigamonkeys.montecarlo import Estimate
 from gigamonkeys.montecarlo import Named
@@ -10,6 +7,7 @@ from gigamonkeys.montecarlo.schedule import Parallel
 from gigamonkeys.montecarlo.schedule import Sequence
 from gigamonkeys.montecarlo.schedule_dsl import Plus
 from gigamonkeys.montecarlo.schedule_dsl import parse
+from gigamonkeys.montecarlo.serialize import dump
 
 
 def show_results(r, indent):
@@ -21,15 +19,6 @@ def show_results(r, indent):
             show_results(c, indent + 1)
 
 
-def default(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
-        return o.isoformat()
-
-
-def json_dump(x):
-    json.dump(x, fp=sys.stdout, indent=2, default=default)
-
-
 class NamedEstimate(Named, Estimate):
     pass
 
@@ -63,4 +52,4 @@ if __name__ == "__main__":
     print()
     show_results(r, 0)
     print()
-    json_dump(asdict(r))
+    dump(r, sys.stdout, indent=2)